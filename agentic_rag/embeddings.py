@@ -0,0 +1,150 @@
+import os
+import re
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from dotenv import load_dotenv
+
+# same model as the HuggingFaceEndpointEmbeddings default, so local and remote vectors are interchangeable
+DEFAULT_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+
+def normalize_query(text: str) -> str:
+    """Cache key of a query: lowercase with collapsed whitespace"""
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class EndpointBackend:
+    """Embeds through a remote Hugging Face inference endpoint (one network call per batch)"""
+
+    def __init__(self, model: str):
+        from langchain_huggingface import HuggingFaceEndpointEmbeddings
+        self.model = model
+        self._embedding = HuggingFaceEndpointEmbeddings(model=model)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self._embedding.embed_documents(texts)
+
+
+class LocalBackend:
+    """Embeds on the local CPU with sentence-transformers, no endpoint needed"""
+
+    def __init__(self, model: str, batch_size: int):
+        from langchain_huggingface import HuggingFaceEmbeddings
+        self.model = model
+        self._embedding = HuggingFaceEmbeddings(
+            model_name=model,
+            model_kwargs={"device": "cpu"},
+            encode_kwargs={"batch_size": batch_size},
+        )
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self._embedding.embed_documents(texts)
+
+
+class DiskCache:
+    """Query embeddings persisted in SQLite so they survive restarts"""
+
+    def __init__(self, path: str):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (model TEXT, text TEXT, vector BLOB, PRIMARY KEY (model, text))"
+        )
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        row = self._connection.execute(
+            "SELECT vector FROM embeddings WHERE model = ? AND text = ?", (model, text)
+        ).fetchone()
+        return array("f", row[0]).tolist() if row else None
+
+    def put(self, model: str, text: str, vector: List[float]):
+        self._connection.execute(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", (model, text, array("f", vector).tobytes())
+        )
+        self._connection.commit()
+
+
+class Embeddings:
+    """Embedding model used for both ingestion and queries.
+
+    Documents are encoded in batches of `batch_size`. Query embeddings are kept in an LRU of
+    `cache_size` entries keyed on the normalized query, and optionally in a `DiskCache`.
+    """
+
+    def __init__(self, backend, batch_size: int = 32, cache_size: int = 1024, disk_cache: Optional[DiskCache] = None):
+        self.backend = backend
+        self.batch_size = batch_size
+        self.cache_size = cache_size
+        self.disk_cache = disk_cache
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        # queries are embedded from several threads of the server's query pool
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def model(self) -> str:
+        return self.backend.model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            embeddings.extend(self.backend.encode(texts[start:start + self.batch_size]))
+        return embeddings
+
+    def embed_query(self, text: str) -> List[float]:
+        key = normalize_query(text)
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return self._cache[key]
+            vector = self.disk_cache.get(self.model, key) if self.disk_cache else None
+
+        if vector is None:
+            # encoding happens outside the lock so concurrent queries don't wait on each other.
+            # The original text is encoded, only the cache key is normalized (models may be cased)
+            vector = self.backend.encode([text])[0]
+            with self._lock:
+                self.misses += 1
+                if self.disk_cache:
+                    self.disk_cache.put(self.model, key, vector)
+        else:
+            with self._lock:
+                self.hits += 1
+
+        with self._lock:
+            self._cache[key] = vector
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+
+def get_embeddings() -> Embeddings:
+    """Builds the embedding model from the environment (.env):
+
+      - EMBEDDING_BACKEND: "endpoint" (default, remote HF inference) or "local" (CPU sentence-transformers)
+      - EMBEDDING_MODEL: model id, defaults to sentence-transformers/all-mpnet-base-v2
+      - EMBEDDING_BATCH_SIZE: documents encoded per batch (32)
+      - EMBEDDING_CACHE_SIZE: query embeddings kept in memory (1024)
+      - EMBEDDING_CACHE_FILE: SQLite file persisting query embeddings, disabled when unset
+    """
+    load_dotenv()
+    model = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL)
+    batch_size = int(os.getenv("EMBEDDING_BATCH_SIZE", "32"))
+
+    if os.getenv("EMBEDDING_BACKEND", "endpoint") == "local":
+        backend = LocalBackend(model, batch_size)
+    else:
+        backend = EndpointBackend(model)
+
+    cache_file = os.getenv("EMBEDDING_CACHE_FILE")
+    return Embeddings(
+        backend,
+        batch_size=batch_size,
+        cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "1024")),
+        disk_cache=DiskCache(cache_file) if cache_file else None,
+    )
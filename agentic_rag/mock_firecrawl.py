@@ -0,0 +1,55 @@
+"""Local stand-in for the Firecrawl search API, for benchmarks and tests without paid calls.
+
+    uv run mock_firecrawl.py --port 3002 --latency 0.5
+    FIRECRAWL_BASE_URL=http://localhost:3002 uv run server.py
+"""
+import argparse
+import asyncio
+
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+
+def create_app(latency: float) -> Starlette:
+    stats = {"searches": 0}
+
+    async def search(request: Request):
+        body = await request.json()
+        stats["searches"] += 1
+        await asyncio.sleep(latency)
+        query = body.get("query", "")
+        return JSONResponse({
+            "success": True,
+            "data": {
+                "web": [
+                    {
+                        "url": f"https://example.com/{i}",
+                        "title": f"Result {i} for {query}",
+                        "description": f"Canned result {i} of the mock search for {query}",
+                    }
+                    for i in range(1, 4)
+                ]
+            },
+        })
+
+    async def get_stats(request: Request):
+        return JSONResponse(stats)
+
+    return Starlette(routes=[
+        Route("/v2/search", search, methods=["POST"]),
+        Route("/stats", get_stats, methods=["GET"]),
+    ])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3002)
+    # seconds each search takes, to mimic the real api
+    parser.add_argument("--latency", type=float, default=0.5)
+    args = parser.parse_args()
+
+    uvicorn.run(create_app(args.latency), host=args.host, port=args.port)
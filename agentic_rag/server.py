@@ -1,71 +1,159 @@
-from typing import List
+import argparse
 import os
+import sys
 
-import chromadb
-import requests
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.startup_profile import startup_profile
+
+# heavy imports timed one by one for --profile-startup, dependencies first
+startup_profile.time_imports(
+    "dotenv", "numpy", "httpx", "pydantic", "starlette", "fastmcp",
+    "shared.tracing", "shared.semantic_cache", "shared.snapshot_index", "embeddings", "vector_db_setup", "web_search",
+)
 from dotenv import load_dotenv
 from fastmcp import FastMCP
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
-from vector_db_setup import collection_name, client_file_name
+from embeddings import get_embeddings
+from shared.semantic_cache import semantic_cache_from_env
+from shared.snapshot_index import SnapshotIndex
+from vector_db_setup import collection_name, client_file_name, INDEX_VERSION_FILE, SNAPSHOT_DIR
+from shared.lazy_resources import LazyResources
+from shared.query_pool import add_metrics_route, query_pool_from_env
+from shared.tracing import annotate, tracer_from_env
+from shared.warm_up import warm_up_after_initialized
+from web_search import web_search_from_env
+
+# before anything reads the environment, every setting below can come from .env
+load_dotenv()
+mcp = FastMCP("aou_faq_collection")
+# spans of every tool call, joined to the client's trace (TRACE_SPANS_FILE / TRACE_METRICS_FILE)
+tracer = tracer_from_env("agentic_rag")
+
+
+# created by load_resources on the first retrieval call, so the handshake and list_tools don't wait for them
+# same backend as vector_db_setup, query and document vectors must come from the same model
+embedding = None
+client = None
+collection = None
+snapshot = None
+# "chroma" (HNSW) or "snapshot": exact search over the memory-mapped embeddings exported by vector_db_setup
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+# answers paraphrases of recent queries without querying the collection, dropped when vector_db_setup changes it
+semantic_cache = semantic_cache_from_env(INDEX_VERSION_FILE, supported_tools=["aou_retrieval_tool"])
+web_search = web_search_from_env()
+# embedding and chroma queries, off the event loop (MAX_CONCURRENT_QUERIES)
+query_pool = query_pool_from_env()
+
+
+def load_resources():
+    """Loads the embedding model, imports chromadb and opens the collection"""
+    global embedding, client, collection, snapshot
+    with startup_profile.step("load embedding model"):
+        embedding = get_embeddings()
+    with startup_profile.step("import chromadb"):
+        import chromadb
+    with startup_profile.step("open collection"):
+        client = chromadb.PersistentClient(path=client_file_name)
+        collection = client.get_collection(collection_name)
+    indexed_model = (collection.metadata or {}).get("embedding_model")
+    if indexed_model and indexed_model != embedding.model:
+        print(f"Warning: collection was embedded with {indexed_model}, queries use {embedding.model}", file=sys.stderr)
+    if RETRIEVAL_BACKEND == "snapshot":
+        with startup_profile.step("map snapshot"):
+            snapshot = SnapshotIndex(SNAPSHOT_DIR)
+
+
+resources = LazyResources(load_resources, tracer)
+
+
+def retrieval_stats():
+    return {
+        "semantic_cache": semantic_cache.stats(),
+        "query_embedding_cache": {"hits": embedding.hits, "misses": embedding.misses} if embedding else None,
+        "web_search": web_search.stats(),
+    }
 
-mcp = FastMCP("aou_faq_collection", host="localhost", port="8080")
 
+add_metrics_route(mcp, query_pool, retrieval_stats)
 
-embedding = HuggingFaceEndpointEmbeddings()
-client = chromadb.PersistentClient(path=client_file_name)
-collection = client.get_collection(collection_name)
 
-@mcp.tool()
-def aou_retrieval_tool(query: str):
-    """
-    Retrieves the most relevant information about the AOU (Arab Open University)
-    It returns answer from FAQ collection, so use it when you encounter a related question
-    :param query: user query to retrieve the most relevant document
-    :return: most relevant documents retrieved from vector db
-    """
+def _retrieve(query_embedding):
     # make sure we run vector_db_setup before
-    query_embedding = embedding.embed_query(query)
+    if snapshot is not None:
+        _, documents, _ = snapshot.search(query_embedding, 3)
+        return documents
 
     results = collection.query(
         query_embeddings=[query_embedding],
         n_results=3
     )
-    docs = results["documents"][0]
+    return results["documents"][0]
+
 
+@mcp.tool()
+@tracer.tool
+async def aou_retrieval_tool(query: str):
+    """
+    Retrieves the most relevant information about the AOU (Arab Open University)
+    It returns answer from FAQ collection, so use it when you encounter a related question
+    :param query: user query to retrieve the most relevant document
+    :return: most relevant documents retrieved from vector db
+    """
+    await resources.ensure()
+    # embedding and query run on the query pool
+    with tracer.span("embed_query"):
+        query_embedding = await query_pool.run(embedding.embed_query, query)
+
+    use_cache = semantic_cache.enabled("aou_retrieval_tool")
+    if use_cache:
+        cached = semantic_cache.get("aou_retrieval_tool", None, query_embedding)
+        annotate(cache_hit=cached is not None)
+        if cached is not None:
+            return cached
+
+    with tracer.span("vector_query", backend="snapshot" if snapshot is not None else "chroma"):
+        docs = await query_pool.run(_retrieve, query_embedding)
+    if use_cache:
+        semantic_cache.put("aou_retrieval_tool", None, query_embedding, docs)
     return docs
 
 @mcp.tool()
-def firecrawl_web_search_tool(query: str) -> List[str]:
+@tracer.tool
+async def firecrawl_web_search_tool(query: str) -> str | dict:
     """
     Search for information related to the user query, using afirecrawl tool.
     You can use this tool to scrape the internet, or get information about something not within your
     knowledge, to further help the user.
 
     :param query: user query
-    :return: list of strings of most relevant web searches
+    :return: most relevant web searches, or {"error", "status"} when the search failed
     """
-
-    url = "https://api.firecrawl.dev/v2/search"
-
-    payload = {
-        "query": query,
-        "timeout": 60000
-    }
-
-    load_dotenv()
-
-    headers = {
-        "Authorization": f"Bearer {os.getenv('firecrawl_api')}",
-        "Content-Type": "application/json"
-    }
-
-    response = requests.request("POST", url, json=payload, headers=headers)
-
-    return response.text
+    # async, so a slow search doesn't hold up aou_retrieval_tool calls
+    return await web_search.search(query)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # stdio: spawned per client, http: long-lived streamable-HTTP server shared by many client sessions
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8080)
+    # load the embedding model and the collection in the background instead of on the first call
+    parser.add_argument("--warm-up", action="store_true")
+    # print the import and init time of each step to stderr, then exit without serving
+    parser.add_argument("--profile-startup", action="store_true")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        resources.load()
+        startup_profile.report()
+        raise SystemExit(0)
+    if args.warm_up:
+        # loads in the background once the first client is connected, the handshake only needs the tool list
+        warm_up_after_initialized(mcp, resources.load)
+
+    print("Starting server", file=sys.stderr)
     # run the server
-    print("Starting server")
-    mcp.run(transport='stdio')
-
+    if args.transport == "http":
+        mcp.run(transport="streamable-http", host=args.host, port=args.port)
+    else:
+        mcp.run(transport='stdio')
@@ -1,9 +1,21 @@
-import chromadb
-from langchain_huggingface import HuggingFaceEndpointEmbeddings
+import hashlib
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from embeddings import get_embeddings
+from shared.chroma_collections import open_collection_for_model
+from shared.snapshot_index import export_snapshot
 
 # vector db name
 collection_name = "aou_faq_collection"
 client_file_name = "./chroma"
+# touched whenever the collection changes, the server drops its cached answers when it does
+INDEX_VERSION_FILE = "index_version"
+# memory-mapped embedding matrix for exact search (RETRIEVAL_BACKEND=snapshot), float32 or float16
+SNAPSHOT_DIR = "snapshot"
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float32")
 # info to be embedded
 info = """
 Question 1: Where is the Arab Open University Oman branch located?
@@ -69,10 +81,15 @@ Answer 20: Applications can be submitted online through the university’s offic
 
 
 def create_vector_db():
+    # imported here so the server can import the constants of this module without chromadb
+    import chromadb
+
     # embedding model and chroma client (vector db)
-    embedding = HuggingFaceEndpointEmbeddings()
+    embedding = get_embeddings()
     client = chromadb.PersistentClient(client_file_name)
-    collection = client.get_or_create_collection(collection_name)
+    # recording the model so the server can tell when its queries would use a different one,
+    # a collection embedded with another model is rebuilt so every pair gets re-embedded
+    collection, _ = open_collection_for_model(client, collection_name, embedding.model)
 
     # converting into Q/A pairs
     lines = info.strip().replace("\n\n", "\n").split("\n")
@@ -82,20 +99,32 @@ def create_vector_db():
     # each Q with its A for embedding, better retrieval
     qa_docs = [f"{q} {a}" for q, a in zip(questions, answers)]
 
-    # sequential string ids: "1", "2", ... for each pair of q/a
-    ids = [str(i + 1) for i in range(len(qa_docs))]
-
-    embeddings = embedding.embed_documents(qa_docs)
-
-    # add to collection
-    collection.add(
-        documents=qa_docs,
-        embeddings=embeddings,
-        ids=ids,
-        metadatas=[{"question": q, "answer": a, "source": "AOU Oman FAQ v1"} for q, a in zip(questions, answers)]
-    )
-
-    print(f"Inserted {len(qa_docs)} Q/A pairs into collection '{collection_name}' with ids {ids[:3]}...")
+    # ids derived from the content of each q/a pair, an unchanged pair keeps its id (and embedding) across runs
+    ids = [hashlib.sha256(doc.encode("utf-8")).hexdigest()[:24] for doc in qa_docs]
+
+    existing_ids = set(collection.get(include=[])["ids"])
+    new = [i for i, id_ in enumerate(ids) if id_ not in existing_ids]
+    deleted_ids = list(existing_ids - set(ids))
+
+    # only new or edited pairs are embedded
+    if new:
+        collection.upsert(
+            documents=[qa_docs[i] for i in new],
+            embeddings=embedding.embed_documents([qa_docs[i] for i in new]),
+            ids=[ids[i] for i in new],
+            metadatas=[{"question": questions[i], "answer": answers[i], "source": "AOU Oman FAQ v1"} for i in new]
+        )
+    # pairs removed from (or edited in) the FAQ text
+    if deleted_ids:
+        collection.delete(ids=deleted_ids)
+
+    print(f"Synced collection '{collection_name}': {len(new)} Q/A pairs inserted, {len(deleted_ids)} deleted, "
+          f"{len(qa_docs) - len(new)} unchanged")
+    if new or deleted_ids or not os.path.exists(SNAPSHOT_DIR):
+        export_snapshot(collection, SNAPSHOT_DIR, "source", dtype=SNAPSHOT_DTYPE)
+    if new or deleted_ids:
+        with open(INDEX_VERSION_FILE, "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
 
     # testing
     query = "How may I apply to AOU?"
@@ -0,0 +1,113 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+from embeddings import normalize_query
+from shared.tracing import annotate
+
+DEFAULT_BASE_URL = "https://api.firecrawl.dev"
+
+
+class FirecrawlSearch:
+    """Firecrawl web search over one pooled async client.
+
+    Results are cached for `ttl` seconds keyed on the normalized query, concurrent searches of the same query
+    share one upstream call, and at most `max_concurrent` searches run at once per upstream host.
+    `base_url` can point to a local stand-in (see mock_firecrawl.py) for benchmarks and tests.
+    """
+
+    # upstream host -> semaphore, shared by every instance talking to that host
+    _upstream_slots: Dict[str, asyncio.Semaphore] = {}
+
+    def __init__(self, api_key: Optional[str], base_url: str = DEFAULT_BASE_URL, timeout: float = 60.0,
+                 max_concurrent: int = 2, ttl: float = 3600.0, max_entries: int = 256):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._client: Optional[httpx.AsyncClient] = None
+        self._slots = self._upstream_slots.setdefault(urlsplit(self.base_url).netloc, asyncio.Semaphore(max_concurrent))
+        # normalized query -> (expires at, response text)
+        self._cache: "OrderedDict[str, tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.hits = 0
+        self.failures = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # created on first use, inside the server's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"},
+                # firecrawl's own search timeout plus some slack for the response
+                timeout=self.timeout + 10,
+            )
+        return self._client
+
+    async def search(self, query: str):
+        """Firecrawl's response text, or {"error", "status"} when the search failed (failures aren't cached)"""
+        key = normalize_query(query)
+        cached = self._cache.get(key)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(key)
+                self.hits += 1
+                annotate(cache_hit=True)
+                return cached[1]
+            del self._cache[key]
+
+        task = self._in_flight.get(key)
+        if task is None:
+            # cached and shared under the normalized query, but firecrawl gets it as asked
+            task = asyncio.ensure_future(self._search(key, query))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _search(self, key: str, query: str):
+        payload = {"query": query, "timeout": int(self.timeout * 1000)}
+        async with self._slots:
+            self.requests += 1
+            try:
+                response = await self.client.post("/v2/search", json=payload)
+            except httpx.HTTPError as e:
+                self.failures += 1
+                return {"error": f"web search failed: {type(e).__name__}"}
+
+        if response.is_error:
+            self.failures += 1
+            return {"error": f"web search returned {response.status_code}", "status": response.status_code}
+
+        self._cache[key] = (time.monotonic() + self.ttl, response.text)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return response.text
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hits": self.hits,
+            "failures": self.failures,
+            "entries": len(self._cache),
+        }
+
+
+def web_search_from_env() -> FirecrawlSearch:
+    """Configured with firecrawl_api (key), FIRECRAWL_BASE_URL, FIRECRAWL_TIMEOUT,
+    FIRECRAWL_MAX_CONCURRENT and FIRECRAWL_CACHE_TTL (.env is loaded by the server)
+    """
+    return FirecrawlSearch(
+        os.getenv("firecrawl_api"),
+        base_url=os.getenv("FIRECRAWL_BASE_URL", DEFAULT_BASE_URL),
+        timeout=float(os.getenv("FIRECRAWL_TIMEOUT", "60")),
+        max_concurrent=int(os.getenv("FIRECRAWL_MAX_CONCURRENT", "2")),
+        ttl=float(os.getenv("FIRECRAWL_CACHE_TTL", "3600")),
+    )
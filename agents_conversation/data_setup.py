@@ -1,56 +1,367 @@
+import argparse
+import hashlib
 import json
+import multiprocessing
 import os
-import pandas as pd
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-import chromadb
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# pandas and chromadb are imported by the ingestion functions, the servers only import the constants below
+from lexical_index import BM25Index
+from shared.chroma_collections import open_collection_for_model
+from shared.snapshot_index import export_snapshot
 
 # vector db name
 collection_name = "aou_tutor_modules_conversations"
+# one document per csv (schema + sample rows), queried to pick the files relevant to a question
+routing_collection_name = "aou_source_routing"
 client_file_name = "./chroma"
 # info to be dir
 CSV_DIR = "./csv"
 # file that holds csv schema summary
 SCHMEA_SUMMARY_FILE = "csv_schema_summary.json"
+# file hash and row count of each ingested csv, unchanged files are skipped on the next run
+MANIFEST_FILE = "ingest_manifest.json"
+# documents of the collection for the BM25 lexical index, rebuilt after every ingestion
+LEXICAL_INDEX_FILE = "lexical_index.json"
+# every csv as an indexed table, for exact lookups of tabular facts (fees, majors, modules...)
+TABLES_DB_FILE = "tables.sqlite3"
+# touched whenever an ingestion changes the collection, servers drop their cached answers when it does
+INDEX_VERSION_FILE = "index_version"
+# memory-mapped embedding matrix for exact search (RETRIEVAL_BACKEND=snapshot), float32 or float16
+SNAPSHOT_DIR = "snapshot"
+SNAPSHOT_DTYPE = os.getenv("SNAPSHOT_DTYPE", "float32")
+# model of chromadb's DefaultEmbeddingFunction, recorded on the collection so a change of model rebuilds it
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+# rows of each csv included in its routing document
+ROUTING_SAMPLE_ROWS = 3
+# rows read from a csv at once, memory stays bounded by this whatever the file size
+CHUNK_ROWS = 10_000
+# documents embedded and written per collection call (capped by the client's max batch size)
+BATCH_SIZE = 256
 
 def flatten_row(row_dict):
     return "\n".join(f"{key}: {value}" for key, value in row_dict.items())
 
 
-def create_vector_db_and_schema_summary():
+def flatten_frame(df):
+    """Vectorized `flatten_row` over all rows of a dataframe, returns a Series of documents"""
+    documents = None
+    for column in df.columns:
+        part = f"{column}: " + df[column].astype(str)
+        documents = part if documents is None else documents + "\n" + part
+    return documents
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def document_id(filename, document):
+    """Id derived from the content, so an unchanged row keeps its id wherever it moves in the file"""
+    return f"{filename}_{hashlib.sha256(document.encode('utf-8')).hexdigest()[:24]}"
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_FILE):
+        return {}
+    with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class BatchWriter:
+    """Upserts documents into the collection in batches, the collection computes the embeddings"""
+
+    def __init__(self, collection, batch_size):
+        self.collection = collection
+        self.batch_size = batch_size
+        # (id, document, metadata) waiting to be written
+        self.pending = []
+
+    def add(self, doc_id, document, metadata):
+        self.pending.append((doc_id, document, metadata))
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.write(self.pending)
+            self.pending = []
+
+    def write(self, batch):
+        self.collection.upsert(
+            ids=[doc_id for doc_id, _, _ in batch],
+            documents=[document for _, document, _ in batch],
+            metadatas=[metadata for _, _, metadata in batch]
+        )
+
+    def close(self):
+        self.flush()
+
+
+# embedding function of a pool worker, loaded once per process
+_worker_embedding_function = None
+
+
+def _init_embedding_worker():
+    global _worker_embedding_function
+    from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    # same model the collection uses by default, so vectors match the ones computed on upsert and query
+    _worker_embedding_function = DefaultEmbeddingFunction()
+
+
+def _embed_documents(documents):
+    return _worker_embedding_function(documents)
+
+
+class ParallelBatchWriter(BatchWriter):
+    """Embeds the batches on a process pool while this process stays the only writer of the collection,
+    so the persistent SQLite store never sees concurrent writers.
+
+    At most 2 batches per worker are in flight, keeping memory bounded while the pool stays busy.
+    """
+
+    def __init__(self, collection, batch_size, workers):
+        super().__init__(collection, batch_size)
+        # spawned rather than forked: the parent holds chromadb's sqlite connection and threads a fork would copy
+        self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_embedding_worker,
+                                        mp_context=multiprocessing.get_context("spawn"))
+        self.in_flight = deque()
+        self.max_in_flight = workers * 2
+
+    def write(self, batch):
+        future = self.pool.submit(_embed_documents, [document for _, document, _ in batch])
+        self.in_flight.append((batch, future))
+        while len(self.in_flight) > self.max_in_flight:
+            self.commit_oldest()
+
+    def commit_oldest(self):
+        batch, future = self.in_flight.popleft()
+        self.collection.upsert(
+            ids=[doc_id for doc_id, _, _ in batch],
+            documents=[document for _, document, _ in batch],
+            metadatas=[metadata for _, _, metadata in batch],
+            embeddings=future.result()
+        )
+
+    def close(self):
+        super().close()
+        while self.in_flight:
+            self.commit_oldest()
+        self.pool.shutdown()
+
+
+def sync_file(collection, writer, filename, path, batch_size):
+    """Streams a csv in chunks, passing its new/changed rows to `writer` and deleting the rows that disappeared
+
+    :return: (columns, number of distinct rows, added count, deleted count)
+    """
+    import pandas as pd
+    existing_ids = set(collection.get(where={"source_file": filename}, include=[])["ids"])
+    seen_ids = set()
+    columns = []
+    rows = added = 0
+    started_at = time.perf_counter()
+
+    for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS):
+        columns = list(chunk.columns)
+        # identical rows share one id, only the first one is kept
+        for row_index, document in zip(chunk.index, flatten_frame(chunk)):
+            doc_id = document_id(filename, document)
+            if doc_id in seen_ids:
+                continue
+            seen_ids.add(doc_id)
+            if doc_id not in existing_ids:
+                writer.add(doc_id, document, {
+                    "source_file": filename,
+                    "row_index": int(row_index),
+                    "columns": str(columns)
+                })
+                added += 1
+        rows += len(chunk)
+
+    if not columns:
+        # empty file, still reporting its header
+        columns = list(pd.read_csv(path, nrows=0).columns)
+
+    deleted_ids = list(existing_ids - seen_ids)
+    for start in range(0, len(deleted_ids), batch_size):
+        collection.delete(ids=deleted_ids[start:start + batch_size])
+
+    elapsed = time.perf_counter() - started_at
+    print(f"{filename}: {rows} rows in {elapsed:.2f}s ({rows / elapsed if elapsed else 0:.0f} rows/s)")
+    return columns, len(seen_ids), added, len(deleted_ids)
+
+
+def table_name(filename):
+    """SQLite table of a csv, e.g. "tutors" for tutors.csv"""
+    return os.path.splitext(filename)[0]
+
+
+def quote_identifier(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def table_exists(connection, filename):
+    return connection.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name(filename),)
+    ).fetchone() is not None
+
+
+def load_table(connection, filename, path):
+    """(Re)creates the table of a csv, streamed in chunks, with a case-insensitive index on every column"""
+    import pandas as pd
+    table = quote_identifier(table_name(filename))
+    connection.execute(f"DROP TABLE IF EXISTS {table}")
+    columns = []
+    for chunk in pd.read_csv(path, chunksize=CHUNK_ROWS):
+        columns = list(chunk.columns)
+        chunk.to_sql(table_name(filename), connection, if_exists="append", index=False)
+    for i, column in enumerate(columns):
+        index = quote_identifier(f"idx_{table_name(filename)}_{i}")
+        connection.execute(f"CREATE INDEX {index} ON {table} ({quote_identifier(column)} COLLATE NOCASE)")
+    connection.commit()
+
+
+def build_routing_index(client, schema_summary):
+    """Embeds a profile of every csv (name, columns and a few rows) so the server can route queries to files
+
+    :return: whether the routing collection was empty before, i.e. servers running without it should open it
+    """
+    import pandas as pd
+    routing_collection = client.get_or_create_collection(routing_collection_name)
+    created = routing_collection.count() == 0
+    profiles = {}
+    for entry in schema_summary:
+        filename = entry["source_file"]
+        sample = pd.read_csv(os.path.join(CSV_DIR, filename), nrows=ROUTING_SAMPLE_ROWS)
+        rows = "\n\n".join(flatten_frame(sample)) if len(sample) else ""
+        profiles[filename] = f"file: {filename}\ncolumns: {', '.join(entry['columns'])}\n\n{rows}"[:2000]
+
+    routing_collection.upsert(
+        ids=list(profiles),
+        documents=list(profiles.values()),
+        metadatas=[{"source_file": filename} for filename in profiles]
+    )
+    removed = set(routing_collection.get(include=[])["ids"]) - profiles.keys()
+    if removed:
+        routing_collection.delete(ids=list(removed))
+    return created
+
+
+def build_lexical_index(collection, page_size):
+    """BM25 index over every document now in the collection, including the rows of skipped files"""
+    ids, documents, source_files = [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not page["ids"]:
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        source_files.extend(metadata["source_file"] for metadata in page["metadatas"])
+        offset += len(page["ids"])
+    return BM25Index(ids, documents, source_files)
+
+
+def create_vector_db_and_schema_summary(workers=1):
+    """
+    :param workers: processes embedding the rows, 1 embeds in this process on upsert
+    """
+    import chromadb
+    import pandas as pd
+
     schema_summary = []
+    manifest = load_manifest()
+    new_manifest = {}
 
     # embedding model and chroma client (vector db)
     client = chromadb.PersistentClient(client_file_name)
-    collection = client.get_or_create_collection(collection_name)
+    collection, rebuilt = open_collection_for_model(client, collection_name, EMBEDDING_MODEL)
+    if rebuilt:
+        # every file has to be embedded again, none can be skipped as unchanged
+        manifest = {}
+    batch_size = min(BATCH_SIZE, client.get_max_batch_size())
+    if workers > 1:
+        writer = ParallelBatchWriter(collection, batch_size, workers)
+    else:
+        writer = BatchWriter(collection, batch_size)
+    started_at = time.perf_counter()
+    total_rows = 0
+    changed = False
+    tables = sqlite3.connect(TABLES_DB_FILE)
 
     for filename in os.listdir(CSV_DIR):
         if filename.endswith(".csv"):
             path = os.path.join(CSV_DIR, filename)
-            df = pd.read_csv(path)
-
-            # convertoing each row to key-value string
-            documents = [flatten_row(row.to_dict()) for _, row in df.iterrows()]
+            file_hash = file_sha256(path)
 
-            collection.add(
-                documents=documents,
-                # embeddings=embeddings,
-                ids=[f"{filename}_row_{i}" for i in range(len(documents))],
-                metadatas=[{
-                    "source_file": filename,
-                    "row_index": i,
-                    "columns": str(list(df.columns))
-                } for i in range(len(documents))]
-            )
+            if manifest.get(filename, {}).get("sha256") == file_hash:
+                # unchanged since the last run, only the header is needed for the schema summary
+                columns = list(pd.read_csv(path, nrows=0).columns)
+                new_manifest[filename] = manifest[filename]
+                print(f"{filename}: unchanged, skipped")
+                if not table_exists(tables, filename):
+                    load_table(tables, filename, path)
+            else:
+                columns, rows, added, deleted = sync_file(collection, writer, filename, path, batch_size)
+                new_manifest[filename] = {"sha256": file_hash, "rows": rows}
+                total_rows += rows
+                print(f"{filename}: {added} rows added, {deleted} rows deleted")
+                changed = changed or bool(added or deleted)
+                load_table(tables, filename, path)
 
             schema_summary.append({
                 "source_file": filename,
-                "columns": list(df.columns)
+                "columns": columns
             })
+
+    # waiting for the batches still being embedded
+    writer.close()
+    elapsed = time.perf_counter() - started_at
+    print(f"Ingested {total_rows} rows in {elapsed:.2f}s ({total_rows / elapsed if elapsed else 0:.0f} rows/s)")
+
+    # files removed from the csv dir
+    for filename in manifest.keys() - new_manifest.keys():
+        collection.delete(where={"source_file": filename})
+        tables.execute(f"DROP TABLE IF EXISTS {quote_identifier(table_name(filename))}")
+        print(f"{filename}: removed")
+        changed = True
+    tables.commit()
+    tables.close()
+
     print("Done creating vector db")
     with open(SCHMEA_SUMMARY_FILE, "w", encoding="utf-8") as f:
         json.dump(schema_summary, f, indent=2)
     print("Done creating schema summary")
+    with open(MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(new_manifest, f, indent=2)
+
+    build_lexical_index(collection, batch_size).save(LEXICAL_INDEX_FILE)
+    print("Done creating lexical index")
+    routing_created = build_routing_index(client, schema_summary)
+    print("Done creating routing index")
+
+    if changed or not os.path.exists(SNAPSHOT_DIR):
+        rows = export_snapshot(collection, SNAPSHOT_DIR, "source_file", dtype=SNAPSHOT_DTYPE, page_size=batch_size)
+        print(f"Done exporting snapshot ({rows} rows)")
+
+    # servers look for a missing routing collection again when the version changes
+    if changed or routing_created:
+        with open(INDEX_VERSION_FILE, "w", encoding="utf-8") as f:
+            f.write(str(time.time()))
 
 
 if __name__ == "__main__":
-    create_vector_db_and_schema_summary()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=1, help="processes embedding the rows in parallel")
+    args = parser.parse_args()
+    create_vector_db_and_schema_summary(workers=args.workers)
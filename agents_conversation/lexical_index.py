@@ -0,0 +1,109 @@
+import heapq
+import json
+import math
+import re
+from collections import Counter, defaultdict
+
+# words, names and module codes such as "m269", "tm105" or "b207-a"
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """In-memory BM25 inverted index over the flattened rows of the collection.
+
+    Exact lookups (names, module codes, ids) are answered from the postings without embedding the query.
+    """
+
+    def __init__(self, ids, documents, source_files, k1=1.5, b=0.75):
+        self.ids = ids
+        self.documents = documents
+        self.source_files = source_files
+        self.k1 = k1
+        self.b = b
+
+        # term -> [(document index, term frequency)]
+        self.postings = defaultdict(list)
+        self.doc_lengths = []
+        for i, document in enumerate(documents):
+            counts = Counter(tokenize(document))
+            for term, frequency in counts.items():
+                self.postings[term].append((i, frequency))
+            self.doc_lengths.append(sum(counts.values()))
+
+        self.avg_doc_length = sum(self.doc_lengths) / len(self.doc_lengths) if self.doc_lengths else 0.0
+        total = len(documents)
+        self.idf = {
+            term: math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self.postings.items()
+        }
+
+    def search(self, query, n_results, source_files=None):
+        """Top `n_results` documents for `query`, optionally restricted to `source_files`
+
+        :return: list of (id, document, score), best first
+        """
+        top = heapq.nlargest(n_results, self._scores(query, source_files).items(), key=lambda item: item[1])
+        return [(self.ids[i], self.documents[i], score) for i, score in top]
+
+    def route(self, query, n_files):
+        """The `n_files` source files holding the best matches of `query`, the lexical counterpart of the routing collection
+
+        :return: file names, best first, none when no term of the query is indexed
+        """
+        best = {}
+        for i, score in self._scores(query).items():
+            source_file = self.source_files[i]
+            best[source_file] = max(best.get(source_file, 0.0), score)
+        return heapq.nlargest(n_files, best, key=best.get)
+
+    def rare_terms(self, query, max_df_ratio=0.01):
+        """Indexed terms of `query` found in at most `max_df_ratio` of the documents: names, codes and ids
+
+        Two queries differing only by these ("What is M269 about?" / "What is M250 about?") read almost
+        the same to an embedding model but ask about different rows.
+        """
+        max_df = max(1, int(len(self.documents) * max_df_ratio))
+        return frozenset(term for term in tokenize(query) if 0 < len(self.postings.get(term, ())) <= max_df)
+
+    def _scores(self, query, source_files=None):
+        """document index -> BM25 score of the documents matching at least one term of `query`"""
+        allowed = set(source_files) if source_files else None
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for i, frequency in self.postings[term]:
+                if allowed is not None and self.source_files[i] not in allowed:
+                    continue
+                length_norm = 1 - self.b + self.b * self.doc_lengths[i] / self.avg_doc_length
+                scores[i] += idf * frequency * (self.k1 + 1) / (frequency + self.k1 * length_norm)
+        return scores
+
+    def save(self, path):
+        # postings are rebuilt on load, only the documents are stored
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self.ids, "documents": self.documents, "source_files": self.source_files}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["ids"], data["documents"], data["source_files"])
+
+
+def reciprocal_rank_fusion(rankings, n_results, k=60):
+    """Fuses several ranked id lists into one, each id scoring sum(1 / (k + rank))
+
+    :param rankings: lists of ids, best first
+    :return: list of (id, fused score), best first
+    """
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1 / (k + rank)
+    return heapq.nlargest(n_results, scores.items(), key=lambda item: item[1])
@@ -0,0 +1,61 @@
+import re
+
+# same estimate as the client's history
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def project_fields(document, fields, known_columns):
+    """Keeps the `fields` lines of a flattened row ("column: value" per line)
+
+    A line only starts a new field when it begins with one of `known_columns`, so multi-line values
+    stay attached to their column. Rows without any of the fields are returned as they are.
+    """
+    wanted = {field.strip().lower() for field in fields}
+    kept, keep = [], False
+    for line in document.split("\n"):
+        column, separator, _ = line.partition(": ")
+        if separator and column.strip().lower() in known_columns:
+            keep = column.strip().lower() in wanted
+        if keep:
+            kept.append(line)
+    return "\n".join(kept) if kept else document
+
+
+def compact_documents(documents, fields=None, known_columns=(), max_doc_chars=None, token_budget=None):
+    """Shrinks retrieved documents before they are sent back to the model
+
+    Documents are projected on `fields`, deduplicated (case and whitespace insensitive), cut to
+    `max_doc_chars` and kept, best first, while they fit in `token_budget`.
+    The first document is always kept, cut to the budget if needed.
+
+    :return: (documents, number of documents left out by the budget)
+    """
+    projected = [project_fields(document, fields, known_columns) if fields else document for document in documents]
+    compacted, seen, used = [], set(), 0
+    for i, document in enumerate(projected):
+        key = dedup_key(document)
+        if key in seen:
+            continue
+
+        if max_doc_chars is not None and len(document) > max_doc_chars:
+            document = document[:max_doc_chars] + "..."
+        tokens = estimate_tokens(document)
+        if token_budget is not None and used + tokens > token_budget:
+            if compacted:
+                # duplicates among the rest would have been dropped anyway, only distinct ones are counted
+                return compacted, len({dedup_key(rest) for rest in projected[i:]} - seen)
+            document = document[:token_budget * CHARS_PER_TOKEN] + "..."
+            tokens = token_budget
+        seen.add(key)
+        compacted.append(document)
+        used += tokens
+    return compacted, 0
+
+
+def dedup_key(document):
+    """Case and whitespace insensitive form of a document, equal for duplicates"""
+    return re.sub(r"\s+", " ", document).strip().lower()
@@ -1,18 +1,250 @@
+import argparse
+import asyncio
 import json
 import os
-from typing import List
+import sqlite3
+import sys
+import threading
+from typing import List, Literal
 
-import chromadb
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.startup_profile import startup_profile
+
+# heavy imports timed one by one for --profile-startup, dependencies first
+startup_profile.time_imports(
+    "numpy", "pydantic", "starlette", "fastmcp",
+    "shared.tracing", "shared.semantic_cache", "shared.snapshot_index", "lexical_index", "result_format", "data_setup",
+)
 from fastmcp import FastMCP
-from data_setup import collection_name, client_file_name, SCHMEA_SUMMARY_FILE
+from pydantic import BaseModel
+from data_setup import (
+    collection_name, routing_collection_name, client_file_name, SCHMEA_SUMMARY_FILE, LEXICAL_INDEX_FILE, TABLES_DB_FILE, table_name,
+    quote_identifier, INDEX_VERSION_FILE, SNAPSHOT_DIR
+)
+from lexical_index import BM25Index, reciprocal_rank_fusion
+from shared.semantic_cache import semantic_cache_from_env
+from shared.snapshot_index import SnapshotIndex
+from result_format import compact_documents
+from shared.lazy_resources import LazyResources
+from shared.query_pool import add_metrics_route, query_pool_from_env
+from shared.tracing import annotate, tracer_from_env
+from shared.warm_up import warm_up_after_initialized
 mcp = FastMCP("aware_agentic_rag")
+# spans of every tool call, joined to the client's trace (TRACE_SPANS_FILE / TRACE_METRICS_FILE)
+tracer = tracer_from_env("agents_conversation")
+
+
+# opened by load_resources on the first retrieval call, so the handshake and list_tools don't wait for them
+client = None
+collection = None
+# same model the collections embed with, used when a query embedding is needed more than once
+embedding_function = None
+# routes source_files="auto" to the most relevant files, built by data_setup
+routing_collection = None
+# index_version when the routing collection was last looked for, looked for again once data_setup changes it
+routing_checked_version = None
+snapshot = None
+lexical_index = None
+# mtime of the lexical index file loaded, data_setup rewrites it on every run
+lexical_index_mtime = None
+
+# files picked for source_files="auto"
+ROUTING_TOP_K = int(os.getenv("ROUTING_TOP_K", "2"))
+# answers paraphrases of recent queries without querying the collection, dropped when data_setup changes it.
+# The rare terms of a query (names, module codes) are part of its key, so only paraphrases about the same
+# entities share an answer, and the cache is skipped without the lexical index to find them.
+semantic_cache = semantic_cache_from_env(
+    INDEX_VERSION_FILE, supported_tools=["aou_retrieval_tool", "aou_batch_retrieval_tool"]
+)
+# "chroma" (HNSW) or "snapshot": exact search over the memory-mapped embeddings exported by data_setup
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "chroma")
+# csv tables loaded by data_setup, opened read-only by open_tables and reopened with their schema
+# whenever data_setup rewrites either of them
+tables = None
+tables_version = None
+tables_lock = threading.Lock()
+# rows returned by one table lookup at most
+MAX_TABLE_ROWS = 100
+
+
+def load_table_columns():
+    """source file -> {normalized column name -> column}, only these names can reach the SQL"""
+    with open(SCHMEA_SUMMARY_FILE, "r", encoding="utf-8") as f:
+        return {
+            entry["source_file"]: {column.strip().lower(): column for column in entry["columns"]}
+            for entry in json.load(f)
+        }
+
+
+table_columns = load_table_columns()
+# every column name, used to split flattened rows into fields
+known_columns = {column for columns in table_columns.values() for column in columns}
+# estimated tokens of the documents returned by one retrieval call
+RESULT_TOKEN_BUDGET = int(os.getenv("RESULT_TOKEN_BUDGET", "1500"))
+# embedding and chroma queries, off the event loop (MAX_CONCURRENT_QUERIES)
+query_pool = query_pool_from_env()
+
+
+def load_resources():
+    """Imports chromadb and opens the collections, the embedding model and the indexes"""
+    global client, collection, embedding_function, snapshot
+    with startup_profile.step("import chromadb"):
+        import chromadb
+        from chromadb.utils.embedding_functions import DefaultEmbeddingFunction
+    with startup_profile.step("open collections"):
+        client = chromadb.PersistentClient(path=client_file_name)
+        collection = client.get_collection(collection_name)
+        open_routing_collection()
+    with startup_profile.step("load embedding model"):
+        embedding_function = DefaultEmbeddingFunction()
+        # the model itself is only loaded by the first embedding
+        embedding_function(["warm up"])
+    if RETRIEVAL_BACKEND == "snapshot":
+        with startup_profile.step("map snapshot"):
+            snapshot = SnapshotIndex(SNAPSHOT_DIR)
+    with startup_profile.step("load lexical index"):
+        reload_lexical_index()
+
+
+def file_mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def reload_lexical_index():
+    """Loads the lexical index again when data_setup rewrote it since it was loaded
+
+    Built by data_setup, without it every mode falls back to vector search.
+    """
+    global lexical_index, lexical_index_mtime
+    mtime = file_mtime(LEXICAL_INDEX_FILE)
+    if mtime is not None and mtime != lexical_index_mtime:
+        # swapped in whole, a search running meanwhile keeps the index it started with
+        lexical_index = BM25Index.load(LEXICAL_INDEX_FILE)
+        lexical_index_mtime = mtime
+
+
+def open_routing_collection():
+    """Opens the routing collection, None (search every file) until data_setup has built it"""
+    global routing_collection, routing_checked_version
+    routing_checked_version = file_mtime(INDEX_VERSION_FILE)
+    try:
+        routing_collection = client.get_collection(routing_collection_name)
+    except Exception:
+        routing_collection = None
+
+
+def indexes_changed():
+    """True when data_setup rewrote an index the server keeps in memory since it was loaded,
+    or may have built the routing collection that was missing
+    """
+    return (
+        file_mtime(LEXICAL_INDEX_FILE) not in (None, lexical_index_mtime)
+        or (routing_collection is None and file_mtime(INDEX_VERSION_FILE) != routing_checked_version)
+    )
+
+
+def reload_indexes():
+    reload_lexical_index()
+    if routing_collection is None and file_mtime(INDEX_VERSION_FILE) != routing_checked_version:
+        open_routing_collection()
+
+
+resources = LazyResources(load_resources, tracer, changed=indexes_changed, reload=reload_indexes)
+
+
+def open_tables():
+    """The read-only connection to the csv tables, None while data_setup hasn't created them
+
+    Reopened, and table_columns/known_columns reloaded, when the tables or the schema summary changed,
+    so the csv files and columns data_setup adds are accepted without restarting the server.
+    """
+    global tables, tables_version, table_columns, known_columns
+    with tables_lock:
+        try:
+            # data_setup writes the tables first and the summary last, both are watched
+            version = (os.stat(TABLES_DB_FILE).st_mtime_ns, os.stat(SCHMEA_SUMMARY_FILE).st_mtime_ns)
+        except FileNotFoundError:
+            return tables
+        if version != tables_version:
+            if tables is not None:
+                tables.close()
+            tables = sqlite3.connect(f"file:{TABLES_DB_FILE}?mode=ro", uri=True)
+            tables.row_factory = sqlite3.Row
+            table_columns = load_table_columns()
+            known_columns = {column for columns in table_columns.values() for column in columns}
+            tables_version = version
+        return tables
+
+
+def retrieval_stats():
+    return {"semantic_cache": semantic_cache.stats()}
+
+
+add_metrics_route(mcp, query_pool, retrieval_stats)
+
+
+def source_files_where(source_files):
+    """Chroma where clause restricting a query to `source_files`, FAQ files when none are given"""
+    if not source_files:
+        # default value
+        source_files = ['FAQ.csv', 'FAQ2.csv']
+    where_clause = None
+    if source_files:
+        where_clause = {"source_file": {"$in": source_files}}
+    return where_clause
+
+
+def embed_query(query):
+    return embedding_function([query])[0]
+
+
+def snapshot_query(query_embedding, n_results, source_files):
+    ids, documents, _ = snapshot.search(query_embedding, n_results, source_files)
+    return {"ids": [ids], "documents": [documents]}
+
+
+def snapshot_group_query(query_embeddings, n_results, source_files):
+    """Same result shape as a multi-query collection.query, answered from the snapshot"""
+    allowed_files = source_files_where(source_files)["source_file"]["$in"]
+    results = {"ids": [], "documents": []}
+    for query_embedding in query_embeddings:
+        ids, documents, _ = snapshot.search(query_embedding, n_results, allowed_files)
+        results["ids"].append(ids)
+        results["documents"].append(documents)
+    return results
+
+
+def route_query(query_embedding):
+    """Picks the most relevant files of a query
+
+    :return: file names, none when the routing index is missing (search everything)
+    """
+    if routing_collection is None:
+        return []
+    results = routing_collection.query(query_embeddings=[query_embedding], n_results=ROUTING_TOP_K, include=[])
+    return results["ids"][0]
 
 
-client = chromadb.PersistentClient(path=client_file_name)
-collection = client.get_collection(collection_name)
+class RetrievalQuery(BaseModel):
+    query: str
+    source_files: list[str] | None = None
+    n_result: int = 6
+    fields: list[str] | None = None
+
 
 @mcp.tool()
-def aou_retrieval_tool(query: str, source_files: list[str] | None = None, n_result: int = 6):
+@tracer.tool
+async def aou_retrieval_tool(
+        query: str,
+        source_files: list[str] | Literal["auto"] | None = "auto",
+        n_result: int = 6,
+        mode: Literal["hybrid", "vector", "lexical"] = "hybrid",
+        fields: list[str] | None = None,
+        max_doc_chars: int | None = None,
+):
     """
     Retrieves relevant information from ChromaDB based on a user query and optional source file filter.
 
@@ -20,53 +252,278 @@ def aou_retrieval_tool(query: str, source_files: list[str] | None = None, n_resu
     including topics such as tutors, modules, faculty, and FAQs.
 
     Default behavior:
-      - If no specific source files are provided, the tool defaults to FAQ sources:
-        ['FAQ.csv', 'FAQ2.csv']
-      - This ensures general questions are answered even when the query is ambiguous.
-
-    Usage:
-      - Before calling this tool, use `get_csv_schema_summary()` to inspect available CSV sources.
-      - Based on the query, select the most relevant files and pass their names via `source_files`.
+      - source_files="auto" (default): the tool picks the most relevant files itself and reports them
+        in "routed_source_files", no need to call `get_csv_schema_summary()` first.
+      - If source_files is None or empty, the tool searches the FAQ sources: ['FAQ.csv', 'FAQ2.csv']
 
     Filtering:
-      - The query will be restricted to documents originating from the specified files.
-      - If multiple files are relevant, pass them as a list:
+      - When you already know the relevant files, pass them to restrict the query to their documents:
           source_files = ["tutors.csv", "faculty.csv"]
+      - `get_csv_schema_summary()` lists the available files and their columns.
+
+    Search mode:
+      - "lexical": exact keyword (BM25) match, best and fastest for names, emails, module codes or ids,
+        e.g. "Alaa", "M269", "TM105"
+      - "vector": semantic search, best for paraphrased or descriptive questions
+      - "hybrid" (default): both, with their rankings fused
 
-    Fallback behavior:
-      - If the query requires broader context or spans multiple domains, pass None to source_files.
-      - This will trigger a full search across all indexed documents without filtering by file.
-      - Use this when the model is unsure which file is best or needs additional information.
+    Result size:
+      - fields: only return these columns of each row, e.g. ["name", "email"]
+        (column names as listed by `get_csv_schema_summary()`), None returns whole rows
+      - max_doc_chars: cut each document to this many characters
+      - duplicate documents are dropped, and documents past the token budget of the call are left out
+        and counted in "omitted"
 
     Notes:
       - if source_files, then it must contain filenames exactly as used during ingestion. Do not include other metadata keys such as 'columns' or nested structures.
       - The number of results returned (`n_result`) can be adjusted manually.
 
     Example:
-      aou_retrieval_tool("Who is Alaa?", source_files=["tutors.csv"])
+      aou_retrieval_tool("Who is Alaa?", source_files=["tutors.csv"], mode="lexical")
+      aou_retrieval_tool("Alaa email", source_files=["tutors.csv"], fields=["name", "email"])
+      aou_retrieval_tool("What is the fee of the business diploma?")
       aou_retrieval_tool("What is the grading policy?", source_files=None)
     """
+    await resources.ensure()
+    # read once, a reload by another call swaps in a new index without touching this one
+    lexical = lexical_index
 
-    if not source_files:
-        # default value
-        source_files = ['FAQ.csv', 'FAQ2.csv']
-    where_clause = None
-    if source_files:
-        where_clause = {"source_file": {"$in": source_files}}
+    use_cache = mode != "lexical" and lexical is not None and semantic_cache.enabled("aou_retrieval_tool")
+    vector_search = mode != "lexical" or lexical is None
+    query_embedding = None
+    if use_cache or (vector_search and (source_files == "auto" or snapshot is not None)):
+        # embedded once, for the cache, the routing and the vector query
+        with tracer.span("embed_query"):
+            query_embedding = await query_pool.run(embed_query, query)
+    if use_cache:
+        cache_key = (
+            source_files if source_files == "auto" else tuple(sorted(source_files or [])),
+            mode,
+            n_result,
+            lexical.rare_terms(query),
+        )
+        cached = semantic_cache.get("aou_retrieval_tool", cache_key, query_embedding)
+        annotate(cache_hit=cached is not None)
+        if cached is not None:
+            return compact_results(cached, fields, max_doc_chars)
+
+    routed_files = None
+    if source_files == "auto":
+        with tracer.span("route_query", lexical=not vector_search) as span:
+            if vector_search:
+                routed_files = await query_pool.run(route_query, query_embedding)
+            else:
+                # lexical searches don't embed the query, routed on the files of its best keyword matches
+                routed_files = lexical.route(query, ROUTING_TOP_K)
+            span.set("routed_files", len(routed_files))
+        where_clause = {"source_file": {"$in": routed_files}} if routed_files else None
+    else:
+        where_clause = source_files_where(source_files)
+    allowed_files = where_clause["source_file"]["$in"] if where_clause else None
+
+    if not vector_search:
+        # no chroma query, answered from the in-memory postings
+        with tracer.span("lexical_search"):
+            matches = lexical.search(query, n_result, allowed_files)
+        results = {"ids": [[doc_id for doc_id, _, _ in matches]], "documents": [[doc for _, doc, _ in matches]]}
+    elif snapshot is not None:
+        with tracer.span("vector_query", backend="snapshot"):
+            results = await query_pool.run(snapshot_query, query_embedding, n_result, allowed_files)
+    else:
+        # the collection embeds query_texts itself, both happen on the query pool
+        with tracer.span("vector_query", backend="chroma", embeds_query=query_embedding is None):
+            results = await query_pool.run(
+                collection.query,
+                query_embeddings=[query_embedding] if query_embedding is not None else None,
+                query_texts=query if query_embedding is None else None,
+                n_results=n_result,
+                where=where_clause,
+                include=["documents"] # for debugging I could append ["metadatas", "data"]
+            )
+        # docs = results["documents"][0]
+
+    if mode == "hybrid" and lexical is not None:
+        with tracer.span("lexical_search"):
+            matches = lexical.search(query, n_result, allowed_files)
+        documents = dict(zip(results["ids"][0], results["documents"][0]))
+        documents.update((doc_id, doc) for doc_id, doc, _ in matches)
+        fused = reciprocal_rank_fusion([results["ids"][0], [doc_id for doc_id, _, _ in matches]], n_result)
+        results = {"ids": [[doc_id for doc_id, _ in fused]], "documents": [[documents[doc_id] for doc_id, _ in fused]]}
 
+    if routed_files is not None:
+        results["routed_source_files"] = routed_files
+    if use_cache:
+        semantic_cache.put("aou_retrieval_tool", cache_key, query_embedding, results)
+    return compact_results(results, fields, max_doc_chars)
 
-    results = collection.query(
-        # query_embeddings=[query_embedding],
-        query_texts=query,
-        n_results=n_result,
-        where=where_clause,
-        include=["documents"] # for debugging I could append ["metadatas", "data"]
+
+def compact_results(results, fields=None, max_doc_chars=None, token_budget=RESULT_TOKEN_BUDGET):
+    """Only what the model reads: the documents, without ids or the None placeholders of the raw query result"""
+    documents, omitted = compact_documents(
+        results["documents"][0], fields, known_columns, max_doc_chars, token_budget
     )
-    # docs = results["documents"][0]
+    compacted = {"documents": documents}
+    if "routed_source_files" in results:
+        compacted["routed_source_files"] = results["routed_source_files"]
+    if omitted:
+        compacted["omitted"] = omitted
+    return compacted
 
-    return results
+@mcp.tool()
+@tracer.tool
+async def aou_batch_retrieval_tool(queries: list[RetrievalQuery]):
+    """
+    Same as `aou_retrieval_tool`, but answers several queries in one call.
+
+    Use it when a question splits into sub-questions, e.g. a fee, a tutor and a module,
+    instead of calling `aou_retrieval_tool` once per sub-question.
+    Each query has its own `source_files` filter, `n_result` and `fields`. Unlike `aou_retrieval_tool`
+    the queries are never routed and always use vector search: list the files of each query
+    (see `get_csv_schema_summary()`), None or empty searches the FAQ sources ['FAQ.csv', 'FAQ2.csv'].
+    The token budget of the call is shared by the queries.
+
+    Example:
+      aou_batch_retrieval_tool([
+        {"query": "Who is Alaa?", "source_files": ["tutors.csv"]},
+        {"query": "What is M269 about?", "source_files": ["modules.csv"], "n_result": 3},
+      ])
+
+    :return: one entry per query, in the same order: {"query", "source_files", "documents"}
+    """
+    await resources.ensure()
+    lexical = lexical_index
+
+    use_cache = lexical is not None and semantic_cache.enabled("aou_batch_retrieval_tool")
+    query_embeddings = None
+    if use_cache or snapshot is not None:
+        # embedded at once, for the cache and the vector queries
+        with tracer.span("embed_query", queries=len(queries)):
+            query_embeddings = await query_pool.run(embedding_function, [query.query for query in queries])
+
+    # query index -> its documents, untrimmed by fields and the token budget
+    query_documents = {}
+    if use_cache:
+        cache_keys = [batch_cache_key(query, lexical) for query in queries]
+        for i, query in enumerate(queries):
+            cached = semantic_cache.get("aou_batch_retrieval_tool", cache_keys[i], query_embeddings[i])
+            if cached is not None:
+                query_documents[i] = cached
+        annotate(cache_hits=len(query_documents))
+
+    # queries sharing a filter are answered by a single collection query
+    groups = {}
+    for i, query in enumerate(queries):
+        if i not in query_documents:
+            key = tuple(sorted(query.source_files)) if query.source_files else None
+            groups.setdefault(key, []).append(i)
+
+    async def query_group(indexes):
+        source_files = queries[indexes[0]].source_files
+        n_results = max(queries[i].n_result for i in indexes)
+        with tracer.span("vector_query", backend="snapshot" if snapshot is not None else "chroma", queries=len(indexes)):
+            if snapshot is not None:
+                return await query_pool.run(snapshot_group_query, [query_embeddings[i] for i in indexes], n_results, source_files)
+            # the collection embeds query_texts itself when the cache didn't need the embeddings
+            return await query_pool.run(
+                collection.query,
+                query_embeddings=[query_embeddings[i] for i in indexes] if query_embeddings is not None else None,
+                query_texts=[queries[i].query for i in indexes] if query_embeddings is None else None,
+                n_results=n_results,
+                where=source_files_where(source_files),
+                include=["documents"]
+            )
+
+    group_indexes = list(groups.values())
+    group_results = await asyncio.gather(*(query_group(indexes) for indexes in group_indexes))
+    for indexes, results in zip(group_indexes, group_results):
+        for position, i in enumerate(indexes):
+            # the group asked for its largest n_result, trimming to this query's own
+            query_documents[i] = results["documents"][position][:queries[i].n_result]
+            if use_cache:
+                semantic_cache.put("aou_batch_retrieval_tool", cache_keys[i], query_embeddings[i], query_documents[i])
+
+    answers = []
+    for i, query in enumerate(queries):
+        documents, omitted = compact_documents(
+            query_documents[i],
+            query.fields,
+            known_columns,
+            token_budget=max(RESULT_TOKEN_BUDGET // len(queries), 1),
+        )
+        answers.append({"query": query.query, "source_files": query.source_files, "documents": documents})
+        if omitted:
+            answers[i]["omitted"] = omitted
+    return answers
+
+
+def batch_cache_key(query, lexical):
+    """Semantic cache filter key of a batch query, fields are applied after the cache"""
+    return tuple(sorted(query.source_files or [])), query.n_result, lexical.rare_terms(query.query)
+
+@mcp.tool()
+@tracer.tool
+def aou_table_lookup_tool(
+        source_file: str,
+        filters: dict[str, str | int | float] | None = None,
+        columns: list[str] | None = None,
+        match: Literal["exact", "contains"] = "exact",
+        limit: int = 20,
+):
+    """
+    Looks up exact rows of a CSV table, use it for tabular facts instead of `aou_retrieval_tool`,
+    e.g. the fee of a major, the credit hours of a module or the majors of a faculty.
+
+    :param source_file: the csv to look into, as listed by `get_csv_schema_summary()`, e.g. "FullTimeLearningFees.csv"
+    :param filters: column -> value the rows must match (all of them), e.g. {"MajorID": "M008"}
+        or {"course_code": "M269"}; None returns the first rows
+    :param columns: columns to return, None returns all of them
+    :param match: "exact" (case-insensitive equality) or "contains" (case-insensitive substring)
+    :param limit: max number of rows returned, from 1 to 100
+    :return: list of matching rows as {column: value}
+
+    Example:
+      aou_table_lookup_tool("OpenLearningFees.csv", {"Major": "Diploma in Business Study"}, ["Major", "Amount (R.O)"])
+      aou_table_lookup_tool("modules.csv", {"course_title": "algorithms"}, match="contains")
+    """
+    connection = open_tables()
+    if connection is None:
+        return "Tables are not available, run data_setup first."
+    if source_file not in table_columns:
+        return f"Unknown source_file {source_file}, expected one of {list(table_columns)}"
+
+    known_columns = table_columns[source_file]
+
+    def resolve(column):
+        resolved = known_columns.get(column.strip().lower())
+        if resolved is None:
+            raise ValueError(f"Unknown column {column} for {source_file}, expected one of {list(known_columns.values())}")
+        return resolved
+
+    try:
+        selected = ", ".join(quote_identifier(resolve(c)) for c in columns) if columns else "*"
+        conditions, params = [], []
+        for column, value in (filters or {}).items():
+            if match == "contains":
+                conditions.append(f"{quote_identifier(resolve(column))} LIKE ?")
+                params.append(f"%{value}%")
+            else:
+                conditions.append(f"{quote_identifier(resolve(column))} = ? COLLATE NOCASE")
+                params.append(value)
+    except ValueError as e:
+        return str(e)
+
+    sql = f"SELECT {selected} FROM {quote_identifier(table_name(source_file))}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " LIMIT ?"
+    try:
+        rows = connection.execute(sql, [*params, min(max(limit, 1), MAX_TABLE_ROWS)]).fetchall()
+    except sqlite3.Error as e:
+        return f"Table lookup failed: {e}"
+    return [dict(row) for row in rows]
 
 @mcp.tool()
+@tracer.tool
 def get_csv_schema_summary():
     """
     Retrieves a summary of all available CSV files in the knowledge corpus.
@@ -82,9 +539,9 @@ def get_csv_schema_summary():
         ...
       ]
 
-    Use this tool before answering any knowledge-based query.
-    It helps determine which file is most relevant, and provides metadata
-    for filtering when calling `aou_retrieval_tool(query, metadata)`.
+    Not needed before `aou_retrieval_tool`, which routes queries to the relevant files by default.
+    Use it to see which files and columns exist, e.g. to pick explicit `source_files`
+    or the table and columns of `aou_table_lookup_tool`.
     """
     with open(SCHMEA_SUMMARY_FILE, "r", encoding="utf-8") as f:
         return json.load(f)
@@ -122,5 +579,27 @@ def get_csv_schema_summary():
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # stdio: spawned per client, http: long-lived streamable-HTTP server shared by many client sessions
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8081)
+    # load chromadb, the collections and the embedding model in the background instead of on the first call
+    parser.add_argument("--warm-up", action="store_true")
+    # print the import and init time of each step to stderr, then exit without serving
+    parser.add_argument("--profile-startup", action="store_true")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        resources.load()
+        startup_profile.report()
+        raise SystemExit(0)
+    if args.warm_up:
+        # loads in the background once the first client is connected, the handshake only needs the tool list
+        warm_up_after_initialized(mcp, resources.load)
+
     # run the server
-    mcp.run(transport='stdio')
\ No newline at end of file
+    if args.transport == "http":
+        mcp.run(transport="streamable-http", host=args.host, port=args.port)
+    else:
+        mcp.run(transport='stdio')
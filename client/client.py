@@ -1,206 +1,377 @@
 import asyncio
+import inspect
 import json
 import os
 import sys
+import time
 from contextlib import AsyncExitStack
-from string import Template
-from typing import Optional, Dict
+from dataclasses import dataclass, asdict
+from typing import Optional, Dict, List
 
+import anyio
 import groq
 import openai
-from mcp import ClientSession, StdioServerParameters, stdio_client
-
-continue_calling_prompt = Template("""
-Right now you are a planning agent, your job is to decide whether the current tool result fully resolves the user’s query or not from previous interactions.
-
-INSTRUCTION: You are NOT calling a tool. You are ONLY returning a decision in JSON format.
-Do NOT wrap your response in a tool call. Do NOT use a tool name like "JSON".
-Just return a plain JSON object as described below.
-
-If it doesn't resolve the user's question reply strictly with the following JSON format, the arguments are provided to you witin the tools
-replace the below templates with the correct potential_next_tool name, args, and their values:
-{
-    "continue": True,
-    "potential_next_tool": "here tool name string",
-    "function": {
-        "arguments": {
-            "arg1":"arg1 value",
-            "arg2": 0,
-            "arg3": null
-        }
-    }
-}
-
-Otherwise reply:
-{
-    "continue": False,
-    "potential_next_tool": null
-    "function": null
-}
-Here is the current tool result:
-${tool_results}
-""")
+from mcp import ClientSession, types
+
+from history import ConversationHistory
+from server_connection import ServerConnection, is_connection_error, parse_server_spec, transport_factory
+from streaming import collect_stream
+from tool_cache import ToolResultCache
+from tool_registry import ToolRegistry
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.tracing import tracer_from_env
+
+# the trace context travels to the servers in the _meta of each tool call, older mcp versions can't send it
+CALL_TOOL_META = "meta" in inspect.signature(ClientSession.call_tool).parameters
+
+@dataclass
+class TurnMetrics:
+    """Counters of a single `process_query` turn"""
+    llm_calls: int = 0
+    tool_calls: int = 0
+    steps: int = 0
+    wall_time: float = 0.0
+    # why the loop ended: "answer", "max_steps" or "latency_budget"
+    stop_reason: str = "answer"
+
 
 class MCPClient:
-    def __init__(self):
-        # managing the connection of the client
-        self.session: Optional[ClientSession] = None
+    def __init__(
+            self,
+            stream: bool = True,
+            tool_timeout: float = 30.0,
+            tool_timeouts: Optional[Dict[str, float]] = None,
+            max_concurrent_tools: int = 4,
+            max_steps: int = 5,
+            latency_budget: float = 60.0,
+            tool_cache: Optional[ToolResultCache] = None,
+    ):
+        # managing the connections of the client, server name -> connection
+        self.connections: Dict[str, ServerConnection] = {}
         # ensures resources are properly closed when not needed in async context
         self.exit_stack = AsyncExitStack()
+        # formatted tools are kept in memory instead of calling list_tools on every prompt
+        self.tool_registry = ToolRegistry()
         # todo: use .env instead
         # self.client = groq.Groq(api_key=sys.argv[2])
         # or
-        self.client = openai.OpenAI(
+        # async client so a completion never blocks the event loop (and the stdio reads of the session)
+        self.client = openai.AsyncOpenAI(
             api_key=sys.argv[2],
             base_url="https://api.groq.com/openai/v1"
         )
+        # stream completions, printing answer tokens as they arrive
+        self.stream = stream
+        # tool calls of one completion run concurrently, each bounded by a timeout (per tool overrides in tool_timeouts)
+        self.tool_timeout = tool_timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.tool_semaphore = asyncio.Semaphore(max_concurrent_tools)
+        # agent loop bounds: LLM/tool rounds per turn and total seconds per turn
+        self.max_steps = max_steps
+        self.latency_budget = latency_budget
+        self.turn_metrics: List[TurnMetrics] = []
+        # opt-in cache of tool results, None forwards every call to the server
+        self.tool_cache = tool_cache
+        # spans of every turn (TRACE_SPANS_FILE) and their latency histograms (TRACE_METRICS_FILE)
+        self.tracer = tracer_from_env("client")
 
     async def connect_to_server(self, server_script_path: str):
         """Connect to an MCP server
 
         Args:
-            server_script_path: Path to the server script (.py or .js)
+            server_script_path: Path to the server script (.py or .js), or URL of a running streamable-HTTP server
         """
-        is_python = server_script_path.endswith('.py')
-        is_js = server_script_path.endswith('.js')
-        if not (is_python or is_js):
-            raise ValueError("Server script must be a .py or .js file")
-
-        command = "uv" if is_python else "node"
-
-        full_dir = os.path.dirname(server_script_path)  # "/path/tp/server/"
-        server_file = os.path.basename(server_script_path)  # e.g. "server.py"
-
-        # preparing the mcp client to run server's script
-        server_params = StdioServerParameters(
-            command=command,
-            args=[
-                "--directory",
-                full_dir,
-                "run",
-                server_file
-            ]
-        )
-        # stdio client: launches the server script then opens a communication via stdio channel
-        # passing server_params to stdio client here tells it what server commands to run in order to launch it
-        stdio_transport = await self.exit_stack.enter_async_context(stdio_client(server_params))
-
-        # stdio client returns a (reader, writer)
-        # which let's the client read/write to the channel/server
-        self.sdtio, self.write = stdio_transport
-
-        # wraps the io streams (read/write) into mcp session object to handle tool invocation and lifecycle
+        await self.connect_to_servers([server_script_path])
 
-        self.session = await self.exit_stack.enter_async_context(ClientSession(self.sdtio, self.write))
+    async def connect_to_servers(self, servers: List[str]):
+        """Connect to several MCP servers concurrently, startup takes as long as the slowest server
 
-        # initializes and starts the session
-        await self.session.initialize()
-
-        # listing available tools
-        response = await self.session.list_tools()
-        tools = response.tools
-        print("\nConnected to server with tools:", [tool.name for tool in tools])
+        Args:
+            servers: one session per entry, either a script path (.py or .js) spawned over stdio
+                or the URL of a warm server started with `--transport http`, e.g. "http://localhost:8080/mcp"
+                (optionally named: "agentic_rag=http://localhost:8080/mcp")
+        """
+        connections = []
+        for server in servers:
+            name, target = parse_server_spec(server)
+            if name in self.connections or any(c.name == name for c in connections):
+                raise ValueError(f"A server named {name} is already connected")
+            connections.append(ServerConnection(
+                name,
+                transport_factory(target),
+                message_handler=self.handle_server_message,
+                on_reconnect=self.handle_reconnect,
+            ))
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*(c.start() for c in connections), return_exceptions=True)
+        for connection, result in zip(connections, results):
+            if isinstance(result, BaseException):
+                print(f"\nFailed to connect to {connection.name}: {result}")
+                continue
+            self.connections[connection.name] = connection
+            self.exit_stack.push_async_callback(connection.close)
+        if not self.connections:
+            raise RuntimeError("Could not connect to any server")
+
+        # a (re)connect may come with a different set of tools (and results)
+        self.tool_registry.invalidate()
+        if self.tool_cache is not None:
+            self.tool_cache.clear()
+        await self.get_and_format_tools()
+        print(f"\nConnected to {list(self.connections)} in {time.perf_counter() - started_at:.2f}s "
+              f"with tools:", self.tool_registry.tool_names)
+
+    def handle_reconnect(self, server_name: str):
+        """A new session may come with a different set of tools (and results)"""
+        print(f"\nReconnected to {server_name}")
+        self.tool_registry.invalidate()
+        if self.tool_cache is not None:
+            self.tool_cache.clear()
+
+    async def handle_server_message(self, message):
+        """Receives notifications sent by the server outside of a request"""
+        if isinstance(message, types.ServerNotification) and isinstance(message.root, types.ToolListChangedNotification):
+            self.tool_registry.invalidate()
 
     async def get_and_format_tools(self):
-        response = await self.session.list_tools()
+        sessions = {name: c.session for name, c in self.connections.items() if c.session is not None}
+        with self.tracer.span("list_tools") as span:
+            misses = self.tool_registry.misses
+            tools = await self.tool_registry.get_tools(sessions)
+            span.set("cached", self.tool_registry.misses == misses)
+            span.set("tools", len(tools))
+        return tools
 
-        available_tools = []
-        for tool in response.tools:
-            available_tools.append({
-                "type": "function",
-                "function": {
-                    "name": tool.name,
-                    "description": tool.description,
-                    "parameters": tool.inputSchema  # already JSON Schema
-                }
-            })
-        return available_tools
-
-    async def prompt_llm(self, messages, model="openai/gpt-oss-120b"):
-        return self.client.chat.completions.create(
-            model=model,
-            tools=await self.get_and_format_tools(),
-            messages=messages,
-        )
+    async def prompt_llm(self, messages, model="openai/gpt-oss-120b", print_tokens=False, tool_choice=None):
+        """Prompts the LLM with the available tools
 
-    async def call_function(self, tool_name: str, tool_args: Dict, session: ClientSession) -> Dict:
-        """Calls a tool and returns its result as a dictionary."""
+        Args:
+            messages: conversation so far
+            model: model name on the provider
+            print_tokens: print content tokens as they are streamed (only for answers shown to the user)
+            tool_choice: forwarded to the API when set, e.g. "none" to force a text answer
+        """
+        kwargs = {
+            "model": model,
+            "tools": await self.get_and_format_tools(),
+            "messages": messages,
+        }
+        if tool_choice is not None:
+            kwargs["tool_choice"] = tool_choice
+
+        with self.tracer.span("llm_completion", model=model, stream=self.stream) as span:
+            if not self.stream:
+                response = await self.client.chat.completions.create(**kwargs)
+            else:
+                started_at = time.perf_counter()
+                stream = await self.client.chat.completions.create(**kwargs, stream=True)
+                response = await collect_stream(stream, started_at, print_tokens=print_tokens)
+                span.set("time_to_first_token", response.time_to_first_token)
+            span.set("finish_reason", response.choices[0].finish_reason)
+            span.set("tool_calls", len(response.choices[0].message.tool_calls or []))
+        return response
+
+    async def call_function(self, tool_name: str, tool_args: Dict) -> Dict:
+        """Calls a tool on the server that owns it and returns its result as a dictionary."""
         tool_name = tool_name
         tool_args = tool_args
-        # tool call
-        print(f"Executing: {tool_name}")
-        result = await session.call_tool(tool_name, tool_args)
-        tool_results = {"call": tool_name, "result": result}
-        print(f"Done executing: {tool_name}")
+        with self.tracer.span("call_tool", tool=tool_name) as span:
+            server_name, server_tool_name = self.tool_registry.route(tool_name)
+            span.set("server", server_name)
+            # cached under the server-side name, per tool TTLs still apply to namespaced tools
+            use_cache = self.tool_cache is not None and self.tool_cache.is_cacheable(server_tool_name)
+            if use_cache:
+                result = self.tool_cache.get(server_name, server_tool_name, tool_args)
+                if result is not None:
+                    print(f"Cached: {tool_name}")
+                    span.set("cached", True)
+                    return {"call": tool_name, "result": result}
+
+            connection = self.connections[server_name]
+            # the server's spans of this call join the trace of the turn
+            kwargs = {"meta": span.context()} if CALL_TOOL_META and self.tracer.enabled else {}
+
+            # tool call
+            print(f"Executing: {tool_name}")
+            session = connection.session
+            try:
+                if session is None:
+                    raise anyio.ClosedResourceError(f"Server {server_name} is not connected")
+                result = await session.call_tool(server_tool_name, tool_args, **kwargs)
+            except Exception as e:
+                # the server may have restarted or dropped the connection, retrying once on a new session.
+                # Errors of a live server (tool errors, output validation...) are raised as they are,
+                # the call may not be safe to repeat
+                if not is_connection_error(e):
+                    raise
+                print(f"Reconnecting to {server_name} after: {e!r}")
+                span.set("reconnected", True)
+                await connection.reconnect(session)
+                result = await connection.session.call_tool(server_tool_name, tool_args, **kwargs)
+            tool_results = {"call": tool_name, "result": result}
+            print(f"Done executing: {tool_name}")
+
+            size = len(result.model_dump_json()) if use_cache or self.tracer.enabled else 0
+            span.set("is_error", result.isError)
+            span.set("payload_bytes", size)
+            if use_cache and not result.isError:
+                self.tool_cache.put(server_name, server_tool_name, tool_args, result, size=size)
         return tool_results
 
-    async def process_query(self, query: str, messages) -> str:
-        """Processes query using ChatGroq"""
+    async def call_functions(self, tool_calls) -> List[Dict]:
+        """Calls every tool requested in a completion concurrently.
 
-        messages.append({
-            "role": "user",
-            "content": query,
-        })
+        At most `max_concurrent_tools` run at once, a call that fails or exceeds its timeout
+        is reported with an "error" entry instead of failing the others.
+        Results are returned in the same order as `tool_calls`.
+        """
 
-        response = await self.prompt_llm(messages)
+        async def run(tool_call) -> Dict:
+            tool_name = tool_call.function.name
+            try:
+                tool_args = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError as e:
+                return {"call": tool_name, "args": tool_call.function.arguments, "error": f"invalid arguments: {e}"}
+
+            timeout = self.tool_timeouts.get(tool_name, self.tool_timeout)
+            async with self.tool_semaphore:
+                try:
+                    tool_results = await asyncio.wait_for(
+                        self.call_function(tool_name, tool_args), timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    return {"call": tool_name, "args": tool_args, "error": f"timed out after {timeout}s"}
+                except Exception as e:
+                    return {"call": tool_name, "args": tool_args, "error": str(e)}
+            tool_results["args"] = tool_args
+            return tool_results
+
+        return await asyncio.gather(*(run(tool_call) for tool_call in tool_calls))
+
+    @staticmethod
+    def format_tool_results(tool_results: List[Dict], history: ConversationHistory) -> List[str]:
+        """Content of the "tool" message answering each call, capped by the history"""
+        outputs = []
+        for tool_result in tool_results:
+            if "error" in tool_result:
+                outputs.append(f"error: {tool_result['error']}")
+            else:
+                outputs.append(history.cap_tool_result(
+                    tool_result["call"],
+                    "\n".join(c.text for c in tool_result["result"].content if isinstance(c, types.TextContent))
+                ))
+        return outputs
+
+    @staticmethod
+    def format_tool_calls(tool_calls) -> List[Dict]:
+        """Tool calls of a completion as message dicts, the ids tie each "tool" result to its call"""
+        return [
+            {
+                "id": tool_call.id or f"call_{i}",
+                "type": "function",
+                "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments or "{}"},
+            }
+            for i, tool_call in enumerate(tool_calls)
+        ]
 
-        # Process response and handle tool calls
-        final_text = []
-        # getting the response (only one no need for a loop)
-        choice = response.choices[0]
-        if choice.finish_reason == 'stop':  # text
-            final_text.append(choice.message.content)
-        elif choice.finish_reason == 'tool_calls':
-            # calling the tool and getting the results
-            tool_name = choice.message.tool_calls[0].function.name
-            tool_args = json.loads(choice.message.tool_calls[0].function.arguments or "{}")
-
-            tool_results = await self.call_function(tool_name,tool_args, self.session)
-            print("first tool")
-            print(tool_results["result"].content[0].text, '\n')
-            messages.append(
-                {"role": "system",
-                 "content": f"Called function: {tool_name}, with args: {tool_args}, and result:\n{json.dumps(tool_results["result"].content[0].text)}"}
-            )
-            # before continuing, we check if we need to call another tool
-            # creating a copy as we want the decision to be internal (not within message history)
-            messages_copied = messages[::]
-            messages_copied.append(
-                {"role": "system", "content": continue_calling_prompt.substitute(tool_results=tool_results)}
-            )
-            response = await self.prompt_llm(messages_copied)
-            ## the LLM will return either json response as described in continue_calling_prompt above
-            should_call_next_tool_obj = json.loads(response.choices[0].message.content)
-            if should_call_next_tool_obj['continue']:
-                tool_name = should_call_next_tool_obj["potential_next_tool"]
-                tool_args = should_call_next_tool_obj['function']['arguments'] or "{}"
-                # should call next tool
-                tool_results = await self.call_function(
-                    tool_name=tool_name,
-                    tool_args=tool_args,
-                    session=self.session
-                )
-                messages.append(
-                    {"role": "system",
-                     "content": f"Called function: {tool_name}, with args: {tool_args}, and result:\n{json.dumps(tool_results["result"].content[0].text)}"}
-                )
-            # getting the next response
-            response = await self.prompt_llm(messages)
-            # # adding last assistant to the list
-            last_message = response.choices[0].message.content
-            messages.append({
-                "role": "assistant",
-                "content": last_message
-            })
-            final_text.append(last_message)
+    async def process_query(self, query: str, history: ConversationHistory) -> str:
+        """Processes query using ChatGroq
+
+        Runs the model's own tool loop: while the completion ends with `tool_calls`, the requested tools
+        are executed and their results appended, until the model answers or `max_steps` / `latency_budget`
+        is reached, in which case the model is asked to answer with what it has.
+        """
+        started_at = time.perf_counter()
+        metrics = TurnMetrics()
+        with self.tracer.span("process_query") as span:
+            final_text = await self._run_turn(query, history, metrics, started_at)
+            metrics.wall_time = time.perf_counter() - started_at
+            for key, value in asdict(metrics).items():
+                span.set(key, value)
+            span.set("history_tokens", history.estimate_tokens())
+        self.turn_metrics.append(metrics)
         # return "\n".join(final_text)
         return str(final_text)
 
+    async def _run_turn(self, query: str, history: ConversationHistory, metrics: TurnMetrics, started_at: float) -> List:
+        """The tool loop of `process_query`, counting its rounds in `metrics`"""
+        # keeping the payload per turn bounded before adding the new query
+        with self.tracer.span("compact_history"):
+            await history.compact()
+        history.start_turn(query)
+
+        final_text = []
+        while True:
+            out_of_steps = metrics.steps >= self.max_steps
+            out_of_time = time.perf_counter() - started_at >= self.latency_budget
+            if out_of_steps or out_of_time:
+                metrics.stop_reason = "max_steps" if out_of_steps else "latency_budget"
+            forced_answer = metrics.stop_reason != "answer"
+
+            response = await self.prompt_llm(
+                history.messages,
+                print_tokens=True,
+                # no more tool rounds allowed, the model has to answer now
+                tool_choice="none" if forced_answer else None,
+            )
+            metrics.llm_calls += 1
+            choice = response.choices[0]
+
+            # a forced answer ends the turn even when the provider ignores tool_choice and asks for tools again
+            if forced_answer or choice.finish_reason != 'tool_calls' or not choice.message.tool_calls:
+                # adding last assistant to the list
+                last_message = choice.message.content or ""
+                history.append({
+                    "role": "assistant",
+                    "content": last_message
+                })
+                final_text.append(last_message)
+                break
+
+            # calling every requested tool at once, then answering each call with its own "tool" message
+            metrics.steps += 1
+            metrics.tool_calls += len(choice.message.tool_calls)
+            tool_calls = self.format_tool_calls(choice.message.tool_calls)
+            tool_results = await self.call_functions(choice.message.tool_calls)
+            outputs = self.format_tool_results(tool_results, history)
+            for tool_result, output in zip(tool_results, outputs):
+                print(f"Called function: {tool_result['call']}, with args: {tool_result['args']}, and result:\n{output}\n")
+            history.append_tool_round(choice.message.content, tool_calls, outputs)
+
+        return final_text
+
+    async def summarize_history(self, summary: str, turns_text: str) -> str:
+        """Folds older turns into the rolling summary of the conversation using the LLM"""
+        response = await self.prompt_llm(
+            [
+                {"role": "system", "content": "Summarize the conversation below in at most 150 words. "
+                                              "Keep names, numbers and facts the user may refer to later."},
+                {"role": "user", "content": f"Previous summary:\n{summary or '-'}\n\nNew turns:\n{turns_text}"},
+            ],
+            tool_choice="none",
+        )
+        return response.choices[0].message.content or summary
+
+    def metrics_summary(self) -> Dict:
+        """Averages of the recorded turns, to compare round-trips per turn between flows"""
+        turns = len(self.turn_metrics)
+        if not turns:
+            return {"turns": 0}
+        return {
+            "turns": turns,
+            "avg_llm_calls": sum(m.llm_calls for m in self.turn_metrics) / turns,
+            "avg_tool_calls": sum(m.tool_calls for m in self.turn_metrics) / turns,
+            "avg_wall_time": sum(m.wall_time for m in self.turn_metrics) / turns,
+            "last_turn": asdict(self.turn_metrics[-1]),
+        }
+
     async def chat_loop(self):
         """Run an interactive chat loop"""
         print("\nMCP Client Started!")
-        print("Type your queries or 'quit' to exit.")
-        messages = []
+        print("Type your queries, 'stats' for cache counters or 'quit' to exit.")
+        history = ConversationHistory(summarize=self.summarize_history)
 
         while True:
 
@@ -210,8 +381,20 @@ class MCPClient:
                 if query.lower() == 'quit':
                     break
 
-                response = await self.process_query(query, messages)
-                print("\n" + response)
+                if query.lower() == 'stats':
+                    print(f"\nTool schema cache: {self.tool_registry.stats()}")
+                    print(f"Turn metrics: {self.metrics_summary()}")
+                    if self.tool_cache is not None:
+                        print(f"Tool result cache: {self.tool_cache.stats()}")
+                    print(f"History: ~{history.estimate_tokens()} tokens in {len(history.turns)} turns")
+                    if self.tracer.enabled:
+                        print(f"Latency (s): {self.tracer.histograms()}")
+                    continue
+
+                response = await self.process_query(query, history)
+                # when streaming, the answer was already printed token by token
+                if not self.stream:
+                    print("\n" + response)
 
             except Exception as e:
                 print(f"\nError: {str(e)}")
@@ -224,12 +407,14 @@ class MCPClient:
 async def main():
     if len(sys.argv) < 2:
         pass
-        print("Usage: python client.py <path_to_server_script>")
+        print("Usage: python client.py <path_to_server_script|server_url>[,...] <api_key>")
         sys.exit(1)
 
-    client = MCPClient()
+    # MCP_TOOL_CACHE=1 enables the tool result cache
+    client = MCPClient(tool_cache=ToolResultCache() if os.getenv("MCP_TOOL_CACHE") == "1" else None)
     try:
-        await client.connect_to_server(sys.argv[1])
+        # several comma separated scripts are connected at once, their tools merged
+        await client.connect_to_servers(sys.argv[1].split(","))
         await client.chat_loop()
     finally:
         await client.cleanup()
@@ -0,0 +1,124 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# rough chars-per-token ratio, good enough to keep the prompt under a budget
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return len(text or "") // CHARS_PER_TOKEN + 1
+
+
+def truncate(text: str, max_chars: int) -> str:
+    if len(text) <= max_chars:
+        return text
+    return f"{text[:max_chars]}...[truncated {len(text) - max_chars} chars]"
+
+
+class ConversationHistory:
+    """Message history of a chat session kept within a token budget.
+
+    Messages are grouped per turn (a user query and everything added while answering it).
+    Before each turn `compact()`:
+      - shortens the tool results of turns older than `keep_recent_turns`
+      - folds the oldest turns into a rolling summary while the history is over `token_budget`
+    so the payload sent per prompt stays roughly constant however long the session runs.
+    Tool results are also capped when added, per tool through `tool_result_caps`.
+    """
+
+    def __init__(
+            self,
+            token_budget: int = 6000,
+            keep_recent_turns: int = 2,
+            old_tool_result_chars: int = 300,
+            default_tool_result_cap: int = 8000,
+            tool_result_caps: Optional[Dict[str, int]] = None,
+            summarize: Optional[Callable[[str, str], Awaitable[str]]] = None,
+            max_summary_chars: int = 2000,
+    ):
+        """
+        Args:
+            token_budget: estimated tokens the history may take before old turns get summarized
+            keep_recent_turns: turns that are never truncated nor summarized
+            old_tool_result_chars: chars kept of a tool result once its turn is no longer recent
+            default_tool_result_cap: max chars of a single tool result
+            tool_result_caps: per tool overrides of default_tool_result_cap
+            summarize: async (previous_summary, turns_text) -> new summary, e.g. backed by the LLM;
+                without it old turns are summarized by keeping the start of each message
+            max_summary_chars: max chars of the rolling summary
+        """
+        self.token_budget = token_budget
+        self.keep_recent_turns = keep_recent_turns
+        self.old_tool_result_chars = old_tool_result_chars
+        self.default_tool_result_cap = default_tool_result_cap
+        self.tool_result_caps = tool_result_caps or {}
+        self.summarize = summarize
+        self.max_summary_chars = max_summary_chars
+
+        self.summary = ""
+        self.turns: List[List[Dict]] = []
+        # ids of the message dicts holding tool results, and of those already shortened
+        self._tool_result_ids = set()
+        self._shortened_ids = set()
+
+    @property
+    def messages(self) -> List[Dict]:
+        """Messages to send to the LLM: the rolling summary followed by the kept turns"""
+        messages = []
+        if self.summary:
+            messages.append({"role": "system", "content": f"Summary of the earlier conversation:\n{self.summary}"})
+        for turn in self.turns:
+            messages.extend(turn)
+        return messages
+
+    def start_turn(self, query: str):
+        self.turns.append([{"role": "user", "content": query}])
+
+    def append(self, message: Dict):
+        self.turns[-1].append(message)
+
+    def append_tool_round(self, content: Optional[str], tool_calls: List[Dict], outputs: List[str]):
+        """The assistant message requesting `tool_calls`, then one "tool" message per output, tied by call id"""
+        self.turns[-1].append({"role": "assistant", "content": content, "tool_calls": tool_calls})
+        for tool_call, output in zip(tool_calls, outputs):
+            message = {"role": "tool", "tool_call_id": tool_call["id"], "content": output}
+            self._tool_result_ids.add(id(message))
+            self.turns[-1].append(message)
+
+    def cap_tool_result(self, tool_name: str, text: str) -> str:
+        return truncate(text, self.tool_result_caps.get(tool_name, self.default_tool_result_cap))
+
+    def estimate_tokens(self) -> int:
+        return sum(estimate_tokens(message.get("content")) for message in self.messages)
+
+    async def compact(self):
+        old_turns = self.turns[:-self.keep_recent_turns] if self.keep_recent_turns else self.turns
+        for turn in old_turns:
+            for message in turn:
+                if id(message) in self._tool_result_ids and id(message) not in self._shortened_ids:
+                    message["content"] = truncate(message["content"], self.old_tool_result_chars)
+                    self._shortened_ids.add(id(message))
+
+        folded = []
+        while self.estimate_tokens() > self.token_budget and len(self.turns) > self.keep_recent_turns:
+            folded.append(self.turns.pop(0))
+        if not folded:
+            return
+
+        turns_text = "\n".join(
+            f"{message['role']}: {message.get('content') or ''}" for turn in folded for message in turn
+        )
+        if self.summarize is not None:
+            summary = await self.summarize(self.summary, turns_text)
+        else:
+            # no summarizer: keeping the start of each user/assistant message
+            lines = [f"{message['role']}: {truncate(message['content'], 200)}"
+                     for turn in folded for message in turn
+                     if id(message) not in self._tool_result_ids and message.get("content")]
+            summary = "\n".join(filter(None, [self.summary, *lines]))
+        # keeping the most recent part of the summary
+        self.summary = summary[-self.max_summary_chars:]
+
+        for turn in folded:
+            for message in turn:
+                self._tool_result_ids.discard(id(message))
+                self._shortened_ids.discard(id(message))
@@ -0,0 +1,186 @@
+import asyncio
+import os
+from typing import AsyncContextManager, Awaitable, Callable, Optional
+from urllib.parse import urlparse
+
+import anyio
+import httpx
+from mcp import ClientSession, StdioServerParameters, stdio_client
+from mcp.client.streamable_http import streamablehttp_client
+from mcp.shared.exceptions import McpError
+from mcp.types import CONNECTION_CLOSED
+
+
+def script_server_params(server_script_path: str) -> StdioServerParameters:
+    """Parameters to launch a server script over stdio
+
+    Args:
+        server_script_path: Path to the server script (.py or .js)
+    """
+    is_python = server_script_path.endswith('.py')
+    is_js = server_script_path.endswith('.js')
+    if not (is_python or is_js):
+        raise ValueError("Server script must be a .py or .js file")
+
+    command = "uv" if is_python else "node"
+
+    full_dir = os.path.dirname(server_script_path)  # "/path/tp/server/"
+    server_file = os.path.basename(server_script_path)  # e.g. "server.py"
+
+    # preparing the mcp client to run server's script
+    return StdioServerParameters(
+        command=command,
+        args=[
+            "--directory",
+            full_dir,
+            "run",
+            server_file
+        ],
+        # without it the server only gets the stdio client's default whitelist (HOME, PATH, ...),
+        # losing TRACE_* and the server settings (RETRIEVAL_BACKEND, SEMANTIC_CACHE_*, ...) set for the client
+        env={**os.environ},
+    )
+
+
+def is_connection_error(error: BaseException) -> bool:
+    """True when `error` means the transport is gone, and not that the server answered with an error"""
+    if isinstance(error, McpError):
+        return error.error.code == CONNECTION_CLOSED
+    return isinstance(error, (anyio.ClosedResourceError, anyio.BrokenResourceError, anyio.EndOfStream,
+                              httpx.TransportError))
+
+
+def is_url(server: str) -> bool:
+    return server.startswith(("http://", "https://"))
+
+
+def parse_server_spec(server: str):
+    """Splits a server spec into (name, target)
+
+    A spec is a script path, e.g. "agentic_rag/server.py" (named after its directory),
+    or the URL of an already running server, optionally named: "agentic_rag=http://localhost:8080/mcp"
+    (named "<host>_<port>" otherwise).
+    """
+    name, separator, target = server.partition("=")
+    if separator and is_url(target):
+        return name, target
+    if is_url(server):
+        url = urlparse(server)
+        return f"{url.hostname}_{url.port}", server
+    return os.path.basename(os.path.dirname(os.path.abspath(server))), server
+
+
+def transport_factory(target: str) -> Callable[[], AsyncContextManager]:
+    """Opens streamable-HTTP for URLs (warm, long-lived server), otherwise spawns the script over stdio"""
+    if is_url(target):
+        return lambda: streamablehttp_client(target)
+    server_params = script_server_params(target)
+    # stdio client: launches the server script then opens a communication via stdio channel
+    return lambda: stdio_client(server_params)
+
+
+class ServerConnection:
+    """Transport and session of one MCP server, reconnecting when the connection is lost.
+
+    The transport and session contexts are entered and exited inside one dedicated task,
+    (anyio requires it), which lets several servers be connected concurrently with `asyncio.gather`.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            transport: Callable[[], AsyncContextManager],
+            message_handler: Optional[Callable[..., Awaitable[None]]] = None,
+            on_reconnect: Optional[Callable[[str], None]] = None,
+            connect_timeout: float = 30.0,
+            retry_delay: float = 0.5,
+            max_retry_delay: float = 10.0,
+    ):
+        """
+        Args:
+            name: server name, used to namespace and route tools
+            transport: returns a new transport context yielding (read, write, ...) streams
+            message_handler: receives server notifications
+            on_reconnect: called with the server name each time a session is re-established
+            connect_timeout: seconds `reconnect()` waits for a new session
+            retry_delay: first delay between reconnect attempts, doubled up to max_retry_delay
+        """
+        self.name = name
+        self.transport = transport
+        self.message_handler = message_handler
+        self.on_reconnect = on_reconnect
+        self.connect_timeout = connect_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self.session: Optional[ClientSession] = None
+        self.reconnects = 0
+        self._task: Optional[asyncio.Task] = None
+        self._ready: Optional[asyncio.Future] = None
+        self._connected = asyncio.Event()
+        # set to end the current session, then either closes or reconnects
+        self._wake = asyncio.Event()
+        self._closed = False
+        self._reconnect_lock = asyncio.Lock()
+
+    async def start(self):
+        """Connects to the server and returns once its session is initialized"""
+        self._ready = asyncio.get_running_loop().create_future()
+        self._task = asyncio.create_task(self._run(), name=f"mcp-{self.name}")
+        await self._ready
+
+    async def _run(self):
+        delay = self.retry_delay
+        while not self._closed:
+            self._wake.clear()
+            try:
+                async with self.transport() as streams:
+                    # the transport returns a (reader, writer, ...)
+                    # which let's the client read/write to the channel/server
+                    read, write = streams[0], streams[1]
+                    # wraps the io streams (read/write) into mcp session object to handle tool invocation and lifecycle
+                    async with ClientSession(read, write, message_handler=self.message_handler) as session:
+                        # initializes and starts the session
+                        await session.initialize()
+                        self.session = session
+                        self._connected.set()
+                        delay = self.retry_delay
+                        if not self._ready.done():
+                            self._ready.set_result(None)
+                        else:
+                            self.reconnects += 1
+                            if self.on_reconnect is not None:
+                                self.on_reconnect(self.name)
+                        await self._wake.wait()
+                continue
+            except Exception as e:
+                if not self._ready.done():
+                    # the first connection fails fast
+                    self._ready.set_exception(e)
+                    return
+                print(f"\nLost connection to {self.name}: {e}")
+            finally:
+                self.session = None
+                self._connected.clear()
+
+            if not self._closed:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    async def reconnect(self, failed_session: Optional[ClientSession] = None):
+        """Replaces the session, unless `failed_session` was already replaced by a concurrent caller"""
+        async with self._reconnect_lock:
+            if self.session is not None and self.session is not failed_session:
+                return
+            self._connected.clear()
+            self._wake.set()
+            await asyncio.wait_for(self._connected.wait(), self.connect_timeout)
+
+    async def close(self):
+        self._closed = True
+        self._wake.set()
+        if self._task is not None:
+            try:
+                await self._task
+            except Exception as e:
+                print(f"Error closing {self.name}: {e}")
@@ -0,0 +1,92 @@
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+
+@dataclass
+class StreamedFunction:
+    name: str = ""
+    arguments: str = ""
+
+
+@dataclass
+class StreamedToolCall:
+    id: Optional[str] = None
+    type: str = "function"
+    function: StreamedFunction = field(default_factory=StreamedFunction)
+
+
+@dataclass
+class StreamedMessage:
+    role: str = "assistant"
+    content: Optional[str] = None
+    tool_calls: Optional[List[StreamedToolCall]] = None
+
+
+@dataclass
+class StreamedChoice:
+    message: StreamedMessage
+    finish_reason: Optional[str] = None
+
+
+@dataclass
+class StreamedCompletion:
+    """Same shape as the parts of `ChatCompletion` the client reads (choices[0].message/finish_reason)"""
+    choices: List[StreamedChoice]
+    # seconds from sending the request until the first content or tool-call delta
+    time_to_first_token: Optional[float] = None
+
+
+async def collect_stream(stream, started_at: float, print_tokens: bool = False) -> StreamedCompletion:
+    """Consumes a streamed chat completion and rebuilds the full message from its deltas.
+
+    Content tokens are printed as they arrive when `print_tokens` is set,
+    tool-call fragments are joined per `index` as the model emits them.
+    """
+    content_parts = []
+    # index -> tool call being assembled
+    tool_calls = {}
+    finish_reason = None
+    time_to_first_token = None
+
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        choice = chunk.choices[0]
+        delta = choice.delta
+
+        if time_to_first_token is None and (delta.content or delta.tool_calls):
+            time_to_first_token = time.perf_counter() - started_at
+
+        if delta.content:
+            content_parts.append(delta.content)
+            if print_tokens:
+                sys.stdout.write(delta.content)
+                sys.stdout.flush()
+
+        for tool_call_delta in delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(tool_call_delta.index, StreamedToolCall())
+            if tool_call_delta.id:
+                tool_call.id = tool_call_delta.id
+            if tool_call_delta.function:
+                if tool_call_delta.function.name:
+                    tool_call.function.name += tool_call_delta.function.name
+                if tool_call_delta.function.arguments:
+                    tool_call.function.arguments += tool_call_delta.function.arguments
+
+        if choice.finish_reason:
+            finish_reason = choice.finish_reason
+
+    if print_tokens and content_parts:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    message = StreamedMessage(
+        content="".join(content_parts) if content_parts else None,
+        tool_calls=[tool_calls[index] for index in sorted(tool_calls)] or None,
+    )
+    return StreamedCompletion(
+        choices=[StreamedChoice(message=message, finish_reason=finish_reason)],
+        time_to_first_token=time_to_first_token,
+    )
@@ -0,0 +1,96 @@
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+def cache_key(server_name: str, tool_name: str, tool_args: Dict) -> str:
+    """Server and tool name plus canonical JSON of its arguments, so argument order doesn't matter"""
+    return f"{server_name}/{tool_name}:{json.dumps(tool_args, sort_keys=True, separators=(',', ':'), default=str)}"
+
+
+class ToolResultCache:
+    """Opt-in TTL/LRU cache of tool results for tools that are deterministic within a session.
+
+    Entries expire after the tool's TTL (`ttls`, falling back to `default_ttl`), and the least recently used ones
+    are evicted once `max_entries` or `max_bytes` is exceeded. Tools in `never_cache` (or with a TTL of 0)
+    are always forwarded to the server.
+    Tools are named as on their server, not by the namespaced name the model sees, so `ttls` and `never_cache`
+    still apply when two servers expose the same tool.
+    """
+
+    def __init__(
+            self,
+            default_ttl: float = 300.0,
+            ttls: Optional[Dict[str, float]] = None,
+            max_entries: int = 256,
+            max_bytes: int = 8 * 1024 * 1024,
+            never_cache: Iterable[str] = (
+                "get_forecast", "get_forecasts", "get_subreddit_news", "get_subreddits_news", "firecrawl_web_search_tool"
+            ),
+    ):
+        self.default_ttl = default_ttl
+        self.ttls = ttls or {}
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.never_cache = set(never_cache)
+
+        # key -> (expires_at, size, result)
+        self._entries: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def is_cacheable(self, tool_name: str) -> bool:
+        return tool_name not in self.never_cache and self.ttls.get(tool_name, self.default_ttl) > 0
+
+    def get(self, server_name: str, tool_name: str, tool_args: Dict) -> Optional[Any]:
+        key = cache_key(server_name, tool_name, tool_args)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        expires_at, _, result = entry
+        if expires_at < time.monotonic():
+            self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return result
+
+    def put(self, server_name: str, tool_name: str, tool_args: Dict, result: Any, size: int):
+        """Stores a result, `size` being its serialized size in bytes"""
+        if size > self.max_bytes:
+            return
+        key = cache_key(server_name, tool_name, tool_args)
+        if key in self._entries:
+            self._remove(key)
+        expires_at = time.monotonic() + self.ttls.get(tool_name, self.default_ttl)
+        self._entries[key] = (expires_at, size, result)
+        self._bytes += size
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+        }
@@ -0,0 +1,98 @@
+import asyncio
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from mcp import ClientSession, types
+
+# separates the server name from the tool name when a tool name exists on several servers
+NAMESPACE_SEPARATOR = "__"
+
+
+def format_tool(tool: types.Tool, name: Optional[str] = None, server_name: Optional[str] = None) -> Dict:
+    """Converts an MCP tool into the OpenAI-style function schema"""
+    description = tool.description
+    if server_name:
+        description = f"[{server_name}] {description or ''}"
+    return {
+        "type": "function",
+        "function": {
+            "name": name or tool.name,
+            "description": description,
+            "parameters": tool.inputSchema  # already JSON Schema
+        }
+    }
+
+
+class ToolRegistry:
+    """In-memory copy of the formatted tools of all connected sessions.
+
+    The lists are fetched once with `list_tools` (concurrently across sessions) and served from memory afterward,
+    they are only fetched again after `invalidate()` (tools/list_changed notification or reconnect).
+    Tools are merged into a single catalog, a name offered by several servers is exposed
+    as "<server>__<tool>" for each of them, and `route()` maps an exposed name back to its server.
+    """
+
+    def __init__(self):
+        self._tools: Optional[List[Dict]] = None
+        # exposed tool name -> (server name, tool name on that server)
+        self._routes: Dict[str, Tuple[str, str]] = {}
+        # avoids several concurrent prompts all missing and calling list_tools at once
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    async def get_tools(self, sessions: Dict[str, ClientSession]) -> List[Dict]:
+        """
+        Args:
+            sessions: server name -> initialized session
+        """
+        if self._tools is not None:
+            self.hits += 1
+            return self._tools
+
+        async with self._lock:
+            # another coroutine may have refreshed while we were waiting
+            if self._tools is not None:
+                self.hits += 1
+                return self._tools
+            self.misses += 1
+
+            names = list(sessions)
+            responses = await asyncio.gather(*(sessions[name].list_tools() for name in names))
+            name_counts = Counter(tool.name for response in responses for tool in response.tools)
+
+            tools, routes = [], {}
+            for server_name, response in zip(names, responses):
+                for tool in response.tools:
+                    if name_counts[tool.name] > 1:
+                        exposed_name = f"{server_name}{NAMESPACE_SEPARATOR}{tool.name}"
+                        tools.append(format_tool(tool, exposed_name, server_name))
+                    else:
+                        exposed_name = tool.name
+                        tools.append(format_tool(tool))
+                    routes[exposed_name] = (server_name, tool.name)
+
+            self._tools, self._routes = tools, routes
+            return self._tools
+
+    def route(self, tool_name: str) -> Tuple[str, str]:
+        """Server name and server-side tool name of an exposed tool name"""
+        if tool_name not in self._routes:
+            raise ValueError(f"Unknown tool: {tool_name}")
+        return self._routes[tool_name]
+
+    @property
+    def tool_names(self) -> List[str]:
+        return [tool["function"]["name"] for tool in self._tools or []]
+
+    def invalidate(self):
+        """Drops the cached list so the next `get_tools` goes to the servers"""
+        self._tools = None
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
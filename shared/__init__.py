@@ -0,0 +1,7 @@
+"""Modules shared by the servers and the client: tracing, caches, startup profile, query pool.
+
+Every entry point runs from its own directory (the servers via `uv --directory <dir> run server.py`),
+so each one puts the repo root on sys.path before its first import from here:
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+"""
@@ -0,0 +1,16 @@
+def open_collection_for_model(client, name, model):
+    """The collection `name`, recorded as embedded with `model`
+
+    A collection embedded with another model (or with an unrecorded one) is dropped and recreated empty:
+    ids only cover the content, so keeping it would leave unchanged rows on the old model's vectors.
+
+    :return: (collection, whether it was recreated)
+    """
+    collection = client.get_or_create_collection(name)
+    recorded = (collection.metadata or {}).get("embedding_model")
+    if recorded == model:
+        return collection, False
+    if collection.count():
+        print(f"Collection '{name}' was embedded with {recorded or 'an unrecorded model'}, rebuilding it with {model}")
+    client.delete_collection(name)
+    return client.create_collection(name, metadata={"embedding_model": model}), True
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+
+class LazyResources:
+    """The heavy resources of a server (chromadb, collections, embedding model, indexes), loaded by `load`
+    on the first tool call or a warm-up instead of at import, so the handshake and list_tools don't wait for them.
+
+    `changed` and `reload`, when given, refresh what ingestion rewrote after the first load.
+    """
+
+    def __init__(self, load, tracer, changed=None, reload=None):
+        self._load = load
+        self.tracer = tracer
+        self._changed = changed
+        self._reload = reload
+        self._lock = threading.Lock()
+        self.loaded = False
+
+    def load(self):
+        """Runs `load` once, whichever thread gets here first"""
+        with self._lock:
+            if not self.loaded:
+                self._load()
+                self.loaded = True
+
+    def reload(self):
+        with self._lock:
+            self._reload()
+
+    async def ensure(self):
+        """Loads the resources, or reloads the changed ones, off the event loop"""
+        if not self.loaded:
+            with self.tracer.span("load_resources"):
+                await asyncio.get_running_loop().run_in_executor(None, self.load)
+        elif self._changed is not None and self._changed():
+            with self.tracer.span("reload_indexes"):
+                await asyncio.get_running_loop().run_in_executor(None, self.reload)
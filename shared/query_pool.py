@@ -0,0 +1,61 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from starlette.responses import JSONResponse
+
+
+class QueryPool:
+    """Bounded thread pool for the blocking work of the retrieval tools (embedding, chroma and snapshot queries).
+
+    One slow query doesn't stall the event loop, and with it every other request of a shared (http) server.
+    At most `max_concurrent` calls run at once, the others wait for a slot, and both are counted in `stats()`.
+    """
+
+    def __init__(self, max_concurrent=4):
+        self.max_concurrent = max_concurrent
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent, thread_name_prefix="retrieval")
+        self.slots = asyncio.Semaphore(max_concurrent)
+        self.metrics = {"completed": 0, "running": 0, "queued": 0, "max_queued": 0, "queue_wait_s": 0.0, "run_s": 0.0}
+
+    async def run(self, fn, *args, **kwargs):
+        """Runs `fn` on the pool, waiting for a free slot while `max_concurrent` calls are running"""
+        metrics = self.metrics
+        queued_at = time.perf_counter()
+        metrics["queued"] += 1
+        metrics["max_queued"] = max(metrics["max_queued"], metrics["queued"])
+        async with self.slots:
+            started_at = time.perf_counter()
+            metrics["queued"] -= 1
+            metrics["running"] += 1
+            metrics["queue_wait_s"] += started_at - queued_at
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+            finally:
+                metrics["running"] -= 1
+                metrics["completed"] += 1
+                metrics["run_s"] += time.perf_counter() - started_at
+
+    def stats(self):
+        completed = self.metrics["completed"] or 1
+        return {
+            **self.metrics,
+            "max_concurrent_queries": self.max_concurrent,
+            "avg_queue_wait_s": self.metrics["queue_wait_s"] / completed,
+            "avg_run_s": self.metrics["run_s"] / completed,
+        }
+
+
+def query_pool_from_env():
+    """Configured with MAX_CONCURRENT_QUERIES"""
+    return QueryPool(int(os.getenv("MAX_CONCURRENT_QUERIES", "4")))
+
+
+def add_metrics_route(mcp, query_pool, extra_stats):
+    """Serves the pool's queueing metrics and `extra_stats()` (caches of the server) on /metrics, http transport only"""
+
+    @mcp.custom_route("/metrics", methods=["GET"])
+    async def retrieval_metrics(request):
+        return JSONResponse({**query_pool.stats(), **extra_stats()})
@@ -0,0 +1,116 @@
+import itertools
+import os
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class SemanticCache:
+    """Retrieval results keyed on the query embedding, so paraphrases of a cached query are answered from memory.
+
+    A lookup hits when an entry of the same tool and filter key has a cosine similarity >= `threshold`
+    with the query. Entries expire after `ttl` seconds, the least recently used are evicted past `max_entries`,
+    and everything is dropped when ingestion touches `version_file`.
+    """
+
+    def __init__(self, threshold=0.95, max_entries=512, ttl=600.0, enabled_tools=(), version_file=None):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.enabled_tools = set(enabled_tools)
+        self.version_file = version_file
+        self._version = self._read_version()
+
+        # entry id -> (tool, filter key, normalized embedding, result, expires at)
+        self._entries = OrderedDict()
+        self._ids = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def enabled(self, tool):
+        return tool in self.enabled_tools
+
+    def _read_version(self):
+        if self.version_file is None or not os.path.exists(self.version_file):
+            return None
+        return os.stat(self.version_file).st_mtime_ns
+
+    def _check_version(self):
+        version = self._read_version()
+        if version != self._version:
+            # the collection changed, cached results may be stale
+            self._version = version
+            self._entries.clear()
+            self.invalidations += 1
+
+    @staticmethod
+    def _normalize(embedding):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, tool, key, embedding):
+        """Cached result of the most similar query above the threshold, None otherwise"""
+        self._check_version()
+        now = time.monotonic()
+        candidates = []
+        for entry_id, (entry_tool, entry_key, vector, _, expires_at) in list(self._entries.items()):
+            if expires_at < now:
+                del self._entries[entry_id]
+            elif entry_tool == tool and entry_key == key:
+                candidates.append((entry_id, vector))
+
+        if candidates:
+            similarities = np.stack([vector for _, vector in candidates]) @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                entry_id = candidates[best][0]
+                self._entries.move_to_end(entry_id)
+                self.hits += 1
+                return self._entries[entry_id][3]
+
+        self.misses += 1
+        return None
+
+    def put(self, tool, key, embedding, result):
+        self._entries[next(self._ids)] = (tool, key, self._normalize(embedding), result, time.monotonic() + self.ttl)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "enabled_tools": sorted(self.enabled_tools),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "invalidations": self.invalidations,
+        }
+
+
+def semantic_cache_from_env(version_file, supported_tools, default_tools=None):
+    """Configured with SEMANTIC_CACHE_TOOLS (comma separated, empty disables the cache),
+    SEMANTIC_CACHE_THRESHOLD, SEMANTIC_CACHE_SIZE and SEMANTIC_CACHE_TTL
+
+    :param supported_tools: the tools of the server that consult the cache, the only ones SEMANTIC_CACHE_TOOLS may name
+    :param default_tools: enabled when SEMANTIC_CACHE_TOOLS isn't set, all the supported ones by default
+    :raise ValueError: when SEMANTIC_CACHE_TOOLS names a tool that doesn't consult the cache
+    """
+    tools = os.getenv("SEMANTIC_CACHE_TOOLS")
+    if tools is None:
+        enabled_tools = list(supported_tools if default_tools is None else default_tools)
+    else:
+        enabled_tools = [tool.strip() for tool in tools.split(",") if tool.strip()]
+    unknown = sorted(set(enabled_tools) - set(supported_tools))
+    if unknown:
+        raise ValueError(f"SEMANTIC_CACHE_TOOLS: {unknown} don't use the semantic cache, expected some of {list(supported_tools)}")
+    return SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "512")),
+        ttl=float(os.getenv("SEMANTIC_CACHE_TTL", "600")),
+        enabled_tools=enabled_tools,
+        version_file=version_file,
+    )
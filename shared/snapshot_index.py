@@ -0,0 +1,133 @@
+import json
+import os
+import shutil
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+EMBEDDINGS_FILE = "embeddings.npy"
+SOURCES_FILE = "sources.npy"
+META_FILE = "meta.json"
+
+
+def export_snapshot(collection, path, source_key, dtype="float32", page_size=1000):
+    """Writes every embedding of the collection into a snapshot that servers memory-map for exact search
+
+    The snapshot holds a contiguous (n, dim) matrix of L2-normalized embeddings, the source of each row
+    as an integer code (`source_key` metadata), and the ids/documents. It is written next to `path` and
+    renamed into place, so readers never see a partial snapshot.
+    """
+    ids, documents, embeddings, sources = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+        if not len(page["ids"]):
+            break
+        ids.extend(page["ids"])
+        documents.extend(page["documents"])
+        embeddings.extend(page["embeddings"])
+        sources.extend((metadata or {}).get(source_key, "") for metadata in page["metadatas"])
+        offset += len(page["ids"])
+
+    matrix = np.asarray(embeddings, dtype=np.float32)
+    if len(matrix):
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+    source_names = sorted(set(sources))
+    codes = {name: code for code, name in enumerate(source_names)}
+
+    tmp_path = f"{path}.tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    np.save(os.path.join(tmp_path, EMBEDDINGS_FILE), np.ascontiguousarray(matrix, dtype=dtype))
+    np.save(os.path.join(tmp_path, SOURCES_FILE), np.asarray([codes[s] for s in sources], dtype=np.int32))
+    with open(os.path.join(tmp_path, META_FILE), "w", encoding="utf-8") as f:
+        json.dump({"ids": ids, "documents": documents, "sources": source_names}, f)
+
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+    return len(ids)
+
+
+class SnapshotState(NamedTuple):
+    """One loaded snapshot, replaced as a whole on reload so a search never mixes two exports"""
+    mtime: int
+    embeddings: np.ndarray
+    sources: np.ndarray
+    ids: list
+    documents: list
+    source_codes: dict
+
+
+class SnapshotIndex:
+    """Exact (brute-force) top-k over a memory-mapped snapshot written by `export_snapshot`.
+
+    For a few thousand rows a matrix-vector product is faster than HNSW + SQLite, and the mapped
+    pages are shared by every server process reading the same snapshot.
+    Scores are cosine similarities, the same ranking as L2 distance on normalized embeddings.
+    Safe to search from several threads: reloads are serialized and swap in a new `SnapshotState`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._state = self._load()
+
+    def _load(self):
+        meta_path = os.path.join(self.path, META_FILE)
+        mtime = os.stat(meta_path).st_mtime_ns
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return SnapshotState(
+            mtime=mtime,
+            embeddings=np.load(os.path.join(self.path, EMBEDDINGS_FILE), mmap_mode="r"),
+            sources=np.load(os.path.join(self.path, SOURCES_FILE), mmap_mode="r"),
+            ids=meta["ids"],
+            documents=meta["documents"],
+            source_codes={name: code for code, name in enumerate(meta["sources"])},
+        )
+
+    def reload_if_changed(self):
+        """Picks up a snapshot re-exported since it was loaded
+
+        :return: the current state
+        """
+        try:
+            mtime = os.stat(os.path.join(self.path, META_FILE)).st_mtime_ns
+        except FileNotFoundError:
+            return self._state
+        if mtime == self._state.mtime:
+            return self._state
+        with self._lock:
+            # another thread may have reloaded it while this one waited
+            if mtime != self._state.mtime:
+                self._state = self._load()
+            return self._state
+
+    def search(self, query_embedding, n_results, sources=None):
+        """Top `n_results` rows for a query embedding, optionally restricted to rows from `sources`
+
+        :return: (ids, documents, scores), best first
+        """
+        # read once, a concurrent reload swaps in a new state without touching this one
+        state = self.reload_if_changed()
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        scores = state.embeddings @ query.astype(state.embeddings.dtype)
+
+        if sources:
+            codes = [state.source_codes[s] for s in sources if s in state.source_codes]
+            scores = np.where(np.isin(state.sources, codes), scores, -np.inf)
+            candidates = int(np.count_nonzero(np.isfinite(scores)))
+        else:
+            candidates = len(scores)
+
+        k = min(n_results, candidates)
+        if k <= 0:
+            return [], [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [state.ids[i] for i in top], [state.documents[i] for i in top], [float(scores[i]) for i in top]
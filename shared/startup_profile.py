@@ -0,0 +1,41 @@
+import importlib
+import sys
+import time
+from contextlib import contextmanager
+
+
+class StartupProfile:
+    """Wall time of each import and initialisation step of a server, reported by --profile-startup"""
+
+    def __init__(self):
+        self.steps = []
+
+    @contextmanager
+    def step(self, name):
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append((name, time.perf_counter() - started_at))
+
+    def record(self, name, seconds):
+        self.steps.append((name, seconds))
+
+    def time_imports(self, *modules):
+        """Imports `modules` in order, one step each
+
+        List dependencies before the modules importing them (e.g. httpx before fastmcp),
+        so each step only counts the module's own import.
+        """
+        for module in modules:
+            with self.step(f"import {module}"):
+                importlib.import_module(module)
+
+    def report(self, file=sys.stderr):
+        width = max((len(name) for name, _ in self.steps), default=0)
+        for name, seconds in self.steps:
+            print(f"{name:<{width}}  {seconds * 1000:9.1f} ms", file=file)
+        print(f"{'total':<{width}}  {sum(seconds for _, seconds in self.steps) * 1000:9.1f} ms", file=file)
+
+
+startup_profile = StartupProfile()
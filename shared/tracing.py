@@ -0,0 +1,219 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# innermost open span of the current task, its children inherit its trace id
+current_span = contextvars.ContextVar("current_span", default=None)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def new_id():
+    return uuid.uuid4().hex[:16]
+
+
+def payload_bytes(value):
+    """Size of a value as the JSON sent over the wire"""
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+def annotate(**attributes):
+    """Sets attributes on the current span, if any"""
+    span = current_span.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def quantile(sorted_values, q):
+    return sorted_values[min(int(q * len(sorted_values)), len(sorted_values) - 1)]
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id):
+        self.name = name
+        self.trace_id = trace_id
+        self.parent_id = parent_id
+        self.span_id = new_id()
+        self.attributes = {}
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def context(self):
+        """What a remote callee needs to attach its spans to this one"""
+        return {"trace_id": self.trace_id, "span_id": self.span_id}
+
+
+class Tracer:
+    """Spans with a trace id shared across processes, and latency histograms per span name.
+
+    Finished spans are appended to `spans_file` (JSONL), and p50/p95/p99 of each span name are written to
+    `metrics_file` in Prometheus text format, at most every `flush_interval` seconds and at exit.
+    With neither file the tracer is disabled and spans cost next to nothing.
+    """
+
+    def __init__(self, service, spans_file=None, metrics_file=None, max_samples=2048, flush_interval=5.0):
+        self.service = service
+        self.spans_file = spans_file
+        self.metrics_file = metrics_file
+        self.flush_interval = flush_interval
+        self.enabled = bool(spans_file or metrics_file)
+        # span name -> latest durations (seconds)
+        self._durations = defaultdict(lambda: deque(maxlen=max_samples))
+        self._counts = defaultdict(int)
+        self._sums = defaultdict(float)
+        # spans end on the event loop and on worker threads
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        if self.metrics_file:
+            atexit.register(self.write_metrics)
+
+    @contextmanager
+    def span(self, name, remote_parent=None, **attributes):
+        """Times the block as a child of the current span, or of `remote_parent` ({"trace_id", "span_id"})
+
+        Yields the Span, whose attributes can be set inside the block. Errors are recorded and re-raised.
+        """
+        if not self.enabled:
+            yield Span(name, None, None)
+            return
+
+        parent = current_span.get()
+        if remote_parent and remote_parent.get("trace_id"):
+            span = Span(name, remote_parent["trace_id"], remote_parent.get("span_id"))
+        elif parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id)
+        else:
+            span = Span(name, new_id(), None)
+        span.attributes.update(attributes)
+
+        token = current_span.set(span)
+        started_at = time.time()
+        start = time.perf_counter()
+        error = None
+        try:
+            yield span
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            current_span.reset(token)
+            self._finish(span, started_at, time.perf_counter() - start, error)
+
+    def tool(self, fn):
+        """Wraps an MCP tool in a span joining the caller's trace, with the documents and bytes it returns
+
+        Applied under `@mcp.tool()`, the wrapper keeps the name, docstring and signature of the tool.
+        """
+        def count(span, result):
+            span.set("payload_bytes", payload_bytes(result))
+            documents = result.get("documents") if isinstance(result, dict) else result
+            if isinstance(documents, list):
+                span.set("docs_returned", len(documents))
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def traced(*args, **kwargs):
+                with self.span(fn.__name__, remote_parent=request_trace_context() if self.enabled else None) as span:
+                    result = await fn(*args, **kwargs)
+                    if self.enabled:
+                        count(span, result)
+                return result
+        else:
+            @functools.wraps(fn)
+            def traced(*args, **kwargs):
+                with self.span(fn.__name__, remote_parent=request_trace_context() if self.enabled else None) as span:
+                    result = fn(*args, **kwargs)
+                    if self.enabled:
+                        count(span, result)
+                return result
+        return traced
+
+    def _finish(self, span, started_at, duration, error):
+        record = {
+            "service": self.service,
+            "name": span.name,
+            "trace_id": span.trace_id,
+            "span_id": span.span_id,
+            "parent_id": span.parent_id,
+            "start": started_at,
+            "duration_ms": round(duration * 1000, 3),
+            "attributes": span.attributes,
+        }
+        if error is not None:
+            record["error"] = error
+
+        with self._lock:
+            self._durations[span.name].append(duration)
+            self._counts[span.name] += 1
+            self._sums[span.name] += duration
+            if self.spans_file:
+                with open(self.spans_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+            flush = self.metrics_file and time.monotonic() - self._flushed_at >= self.flush_interval
+        if flush:
+            self.write_metrics()
+
+    def histograms(self):
+        """span name -> count, sum and latency quantiles (seconds) over the latest samples"""
+        with self._lock:
+            durations = {name: sorted(values) for name, values in self._durations.items()}
+            counts, sums = dict(self._counts), dict(self._sums)
+        return {
+            name: {"count": counts[name], "sum": sums[name], **{f"p{int(q * 100)}": quantile(values, q) for q in QUANTILES}}
+            for name, values in durations.items() if values
+        }
+
+    def write_metrics(self):
+        lines = ["# TYPE span_duration_seconds summary"]
+        for name, histogram in sorted(self.histograms().items()):
+            labels = f'service="{self.service}",span="{name}"'
+            for q in QUANTILES:
+                lines.append(f'span_duration_seconds{{{labels},quantile="{q}"}} {histogram[f"p{int(q * 100)}"]:.6f}')
+            lines.append(f"span_duration_seconds_count{{{labels}}} {histogram['count']}")
+            lines.append(f"span_duration_seconds_sum{{{labels}}} {histogram['sum']:.6f}")
+
+        # written aside and renamed, a scraper never reads half a file
+        with self._write_lock:
+            tmp_path = f"{self.metrics_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            os.replace(tmp_path, self.metrics_file)
+            self._flushed_at = time.monotonic()
+
+
+def request_trace_context():
+    """Trace context the client sent in the _meta of the tool call being served, None when it sent none"""
+    # server side only, the client never imports it
+    from mcp.server.lowlevel.server import request_ctx
+    try:
+        meta = request_ctx.get().meta
+    except LookupError:
+        return None
+    trace_id = getattr(meta, "trace_id", None)
+    if not trace_id:
+        return None
+    return {"trace_id": trace_id, "span_id": getattr(meta, "span_id", None)}
+
+
+def tracer_from_env(service):
+    """Configured with TRACE_SPANS_FILE (JSONL, shared by every process of a trace) and TRACE_METRICS_FILE
+    (Prometheus text, one per process: "{service}" in the name is replaced by the service name)
+    """
+    metrics_file = os.getenv("TRACE_METRICS_FILE")
+    return Tracer(
+        service,
+        spans_file=os.getenv("TRACE_SPANS_FILE"),
+        metrics_file=metrics_file.format(service=service) if metrics_file else None,
+    )
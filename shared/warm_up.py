@@ -0,0 +1,25 @@
+import threading
+
+from mcp import types
+
+
+def warm_up_after_initialized(mcp, load):
+    """Runs `load` on a background thread once the first client has completed the handshake
+
+    Started by the client's initialized notification rather than before `mcp.run()`, so loading doesn't
+    compete with the server's own startup and the initialize/list_tools round trips it would slow down.
+    """
+    # the low-level server dispatches notifications by type, FastMCP registers no handler for this one
+    server = mcp._mcp_server
+    previous = server.notification_handlers.get(types.InitializedNotification)
+    started = False
+
+    async def on_initialized(notification):
+        nonlocal started
+        if not started:
+            started = True
+            threading.Thread(target=load, name="warm-up", daemon=True).start()
+        if previous is not None:
+            await previous(notification)
+
+    server.notification_handlers[types.InitializedNotification] = on_initialized
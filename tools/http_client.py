@@ -0,0 +1,165 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+import httpx
+
+from shared.tracing import annotate
+
+MAX_AGE_PATTERN = re.compile(r"(?:s-maxage|max-age)\s*=\s*(\d+)")
+
+
+class FetchError(Exception):
+    """A failed upstream request, returned to the model as `to_dict()` instead of a bare None"""
+
+    def __init__(self, url: str, reason: str, status: Optional[int] = None):
+        super().__init__(f"{reason} ({url})")
+        self.url = url
+        self.reason = reason
+        self.status = status
+
+    def to_dict(self) -> dict:
+        error = {"error": self.reason, "url": self.url}
+        if self.status is not None:
+            error["status"] = self.status
+        return error
+
+
+def cache_ttl(headers: httpx.Headers, default_ttl: float) -> float:
+    """Seconds a response may be reused: Cache-Control max-age minus Age when present, `default_ttl` otherwise"""
+    cache_control = headers.get("cache-control", "").lower()
+    if "no-store" in cache_control or "no-cache" in cache_control or "private" in cache_control:
+        return 0.0
+    match = MAX_AGE_PATTERN.search(cache_control)
+    if match is None:
+        return default_ttl
+    try:
+        age = float(headers.get("age", 0))
+    except ValueError:
+        age = 0.0
+    return max(float(match.group(1)) - age, 0.0)
+
+
+class HttpClient:
+    """One pooled httpx client shared by every tool call.
+
+    Connections are kept alive between calls (HTTP/2 when `http2` and the h2 package are available),
+    concurrent GETs of the same url share one upstream request, and JSON responses are cached
+    for their Cache-Control lifetime, `default_ttl` when the upstream doesn't say.
+    """
+
+    def __init__(self, user_agent: str, timeout: float = 30.0, max_connections: int = 20,
+                 http2: bool = False, max_entries: int = 512):
+        self.user_agent = user_agent
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.max_entries = max_entries
+        self._client: Optional[httpx.AsyncClient] = None
+        # url -> (expires at, json body)
+        self._cache: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self._in_flight: dict[str, asyncio.Task] = {}
+        self.requests = 0
+        self.cache_hits = 0
+        self.coalesced = 0
+        self.failures = 0
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # created on first use, inside the server's event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                headers={"User-Agent": self.user_agent, "Accept": "application/json"},
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections, keepalive_expiry=60.0),
+                http2=self.http2 and self._h2_available(),
+            )
+        return self._client
+
+    @staticmethod
+    def _h2_available() -> bool:
+        try:
+            import h2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    async def get_json(self, url: str, default_ttl: float = 60.0) -> Any:
+        """GET `url` and decode its JSON body, from the cache when still fresh
+
+        :raise FetchError: on network errors, error statuses and invalid JSON
+        """
+        cached = self._cache.get(url)
+        if cached is not None:
+            if cached[0] > time.monotonic():
+                self._cache.move_to_end(url)
+                self.cache_hits += 1
+                annotate(cache_hit=True)
+                return cached[1]
+            del self._cache[url]
+
+        task = self._in_flight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(url, default_ttl))
+            self._in_flight[url] = task
+            task.add_done_callback(lambda _: self._in_flight.pop(url, None))
+        else:
+            self.coalesced += 1
+            annotate(coalesced=True)
+        # shielded so a cancelled caller doesn't cancel the request others are waiting on
+        return await asyncio.shield(task)
+
+    async def _fetch(self, url: str, default_ttl: float) -> Any:
+        self.requests += 1
+        try:
+            response = await self.client.get(url)
+            response.raise_for_status()
+            data = response.json()
+        except httpx.HTTPStatusError as e:
+            self.failures += 1
+            raise FetchError(url, f"upstream returned {e.response.status_code}", e.response.status_code) from e
+        except httpx.TimeoutException as e:
+            self.failures += 1
+            raise FetchError(url, "upstream timed out") from e
+        except httpx.HTTPError as e:
+            self.failures += 1
+            raise FetchError(url, f"request failed: {type(e).__name__}") from e
+        except ValueError as e:
+            self.failures += 1
+            raise FetchError(url, "invalid JSON response", response.status_code) from e
+
+        ttl = cache_ttl(response.headers, default_ttl)
+        if ttl > 0:
+            self._cache[url] = (time.monotonic() + ttl, data)
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "coalesced": self.coalesced,
+            "failures": self.failures,
+            "cached_entries": len(self._cache),
+            "http2": self.http2 and self._h2_available(),
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+def http_client_from_env(user_agent: str) -> HttpClient:
+    """Configured with HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP2 (1 to enable, needs h2) and HTTP_CACHE_SIZE"""
+    return HttpClient(
+        user_agent,
+        timeout=float(os.getenv("HTTP_TIMEOUT", "30")),
+        max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "20")),
+        http2=os.getenv("HTTP2", "0") == "1",
+        max_entries=int(os.getenv("HTTP_CACHE_SIZE", "512")),
+    )
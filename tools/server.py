@@ -1,41 +1,67 @@
+import argparse
+import asyncio
+import os
+import sys
 from typing import Any, List
+from urllib.parse import urlsplit
 
-import httpx
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from shared.startup_profile import startup_profile
+
+# heavy imports timed one by one for --profile-startup, dependencies first
+startup_profile.time_imports("httpx", "pydantic", "starlette", "fastmcp", "shared.tracing", "http_client")
 from fastmcp import FastMCP
+from pydantic import BaseModel
+from starlette.responses import JSONResponse
+
+from http_client import FetchError, http_client_from_env
+from shared.tracing import tracer_from_env
 
 
 
 # init mcp server
 mcp = FastMCP("my_cool_tools")
+# spans of every tool call, joined to the client's trace (TRACE_SPANS_FILE / TRACE_METRICS_FILE)
+tracer = tracer_from_env("tools")
 USER_AGENT = "my-tools-app"
+# shared by every tool call, keeps connections to reddit and open-meteo alive
+http = http_client_from_env(USER_AGENT)
 
-async def make_request(url: str, USER_AGENT) -> dict[str, Any] | None:
-    """Make a request to the weather API with proper error handling."""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json"
-    }
-
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.get(url, headers=headers, timeout=30.0)
-            response.raise_for_status()
-            return response.json()
-        except:
-            return None
+# fallback cache lifetimes when the upstream sends no Cache-Control
+SUBREDDIT_TTL = 60.0
+FORECAST_TTL = 300.0
+# locations sent to open-meteo in one get_forecasts request, the url grows with each of them
+MAX_FORECAST_LOCATIONS = int(os.getenv("MAX_FORECAST_LOCATIONS", "50"))
+# subreddits fetched at once by get_subreddits_news, reddit rate limits bursts
+MAX_CONCURRENT_FETCHES = int(os.getenv("MAX_CONCURRENT_FETCHES", "4"))
+subreddit_slots = asyncio.Semaphore(MAX_CONCURRENT_FETCHES)
 
-@mcp.tool()
-async def get_subreddit_news(subreddit: str, limit: int = 5)-> List[dict]:
-    """Gets by default hot 5 posts from subreddits param
-    :param subreddit: the subredit to look for, e.g. worldnews, tech, news, etc.
-    :return: a list of dict features posts properties
+
+async def make_request(url: str, ttl: float) -> dict[str, Any]:
+    """Make a request through the shared client, cached for `ttl` seconds unless the upstream says otherwise.
+
+    :raise FetchError: when the request fails
     """
+    with tracer.span("http_get", host=urlsplit(url).netloc):
+        return await http.get_json(url, default_ttl=ttl)
+
+
+@mcp.custom_route("/metrics", methods=["GET"])
+async def http_metrics(request):
+    """Connection reuse and cache metrics of the shared client (http transport only)"""
+    return JSONResponse(http.stats())
+
+async def fetch_subreddit(subreddit: str, limit: int) -> List[dict] | dict:
+    """Hot posts of one subreddit, {"error", "url", "status"} on failure"""
     url = f"https://www.reddit.com/r/{subreddit}/hot.json?limit={limit}"
 
-    response = await make_request(url, USER_AGENT)
+    try:
+        response = await make_request(url, SUBREDDIT_TTL)
+    except FetchError as e:
+        return e.to_dict()
 
-    if not response or "data" not in response:
-        return "Unable to fetch subreddit data."
+    if "data" not in response:
+        return {"error": "unexpected response, no data", "url": url}
 
     posts = []
 
@@ -53,25 +79,20 @@ async def get_subreddit_news(subreddit: str, limit: int = 5)-> List[dict]:
         })
 
     return posts
-@mcp.tool()
-async def get_forecast(latitude: float, longitude: float) -> str:
-    """Get current weather forecast for a location.
 
-    Args:
-        latitude: Latitude of the location
-        longitude: Longitude of the location
-    """
-    url = (
+
+def forecast_url(latitudes: List[float], longitudes: List[float]) -> str:
+    # open-meteo takes comma separated coordinates and answers with one entry per location
+    return (
         f"https://api.open-meteo.com/v1/forecast?"
-        f"latitude={latitude}&longitude={longitude}"
+        f"latitude={','.join(str(latitude) for latitude in latitudes)}"
+        f"&longitude={','.join(str(longitude) for longitude in longitudes)}"
         f"&current=temperature_2m,wind_speed_10m,weather_code"
         f"&timezone=auto"
     )
 
-    data = await make_request(url, USER_AGENT)
-    if not data or "current" not in data:
-        return "Unable to fetch forecast data for this location."
 
+def format_forecast(data: dict) -> str:
     current = data["current"]
     units = data.get("current_units", {})
 
@@ -86,11 +107,143 @@ async def get_forecast(latitude: float, longitude: float) -> str:
     )
 
 
+class Location(BaseModel):
+    latitude: float
+    longitude: float
+
+
+def location_error(location: Location) -> str | None:
+    """Why open-meteo would reject the location, None when it is valid"""
+    if not -90 <= location.latitude <= 90:
+        return "latitude must be between -90 and 90"
+    if not -180 <= location.longitude <= 180:
+        return "longitude must be between -180 and 180"
+    return None
+
+
+@mcp.tool()
+@tracer.tool
+async def get_subreddit_news(subreddit: str, limit: int = 5) -> List[dict] | dict:
+    """Gets by default hot 5 posts from subreddits param
+    :param subreddit: the subredit to look for, e.g. worldnews, tech, news, etc.
+    :return: a list of dict features posts properties, or {"error", "url", "status"} when reddit can't be reached
+    """
+    return await fetch_subreddit(subreddit, limit)
+
+
+@mcp.tool()
+@tracer.tool
+async def get_subreddits_news(subreddits: List[str], limit: int = 5) -> dict:
+    """Same as `get_subreddit_news` for several subreddits in one call, fetched concurrently.
+    Use it instead of calling `get_subreddit_news` once per subreddit.
+
+    :param subreddits: the subreddits to look for, e.g. ["worldnews", "tech"]
+    :param limit: hot posts per subreddit
+    :return: subreddit -> list of posts, or {"error", "url", "status"} for the subreddits that failed
+    """
+    async def fetch(subreddit):
+        async with subreddit_slots:
+            return await fetch_subreddit(subreddit, limit)
+
+    subreddits = list(dict.fromkeys(subreddits))
+    results = await asyncio.gather(*(fetch(subreddit) for subreddit in subreddits))
+    return dict(zip(subreddits, results))
+
+
+@mcp.tool()
+@tracer.tool
+async def get_forecast(latitude: float, longitude: float) -> str | dict:
+    """Get current weather forecast for a location.
+
+    Args:
+        latitude: Latitude of the location
+        longitude: Longitude of the location
+
+    Returns {"error", "url", "status"} when the forecast can't be fetched.
+    """
+    url = forecast_url([latitude], [longitude])
+
+    try:
+        data = await make_request(url, FORECAST_TTL)
+    except FetchError as e:
+        return e.to_dict()
+    if "current" not in data:
+        return {"error": "no forecast data for this location", "url": url}
+
+    return format_forecast(data)
+
+
+@mcp.tool()
+@tracer.tool
+async def get_forecasts(locations: List[Location]) -> List[dict]:
+    """Get current weather forecasts for several locations with a single upstream request.
+    Use it instead of calling `get_forecast` once per location.
+
+    Args:
+        locations: e.g. [{"latitude": 23.58, "longitude": 58.38}, {"latitude": 25.2, "longitude": 55.27}]
+
+    Returns one entry per location, in the same order: {"latitude", "longitude", "forecast"},
+    or {"latitude", "longitude", "error"} for the invalid locations, the ones past the per-call limit
+    (their error gives it) and the ones without data.
+    """
+    forecasts = [{"latitude": location.latitude, "longitude": location.longitude} for location in locations]
+    # only the valid locations are sent upstream, one bad coordinate would fail the whole request
+    valid = []
+    for i, location in enumerate(locations):
+        error = location_error(location)
+        if error is not None:
+            forecasts[i]["error"] = error
+        elif len(valid) >= MAX_FORECAST_LOCATIONS:
+            forecasts[i]["error"] = f"at most {MAX_FORECAST_LOCATIONS} locations per call, ask for this one separately"
+        else:
+            valid.append(i)
+    if not valid:
+        return forecasts
+    url = forecast_url([locations[i].latitude for i in valid], [locations[i].longitude for i in valid])
+
+    try:
+        data = await make_request(url, FORECAST_TTL)
+    except FetchError as e:
+        error = e.to_dict()
+        for i in valid:
+            forecasts[i].update(error)
+        return forecasts
+    # a single location is answered with an object instead of a list
+    entries = data if isinstance(data, list) else [data]
+
+    for position, i in enumerate(valid):
+        entry = entries[position] if position < len(entries) else None
+        if isinstance(entry, dict) and "current" in entry:
+            forecasts[i]["forecast"] = format_forecast(entry)
+        else:
+            forecasts[i]["error"] = "no forecast data for this location"
+    return forecasts
+
+
 
 
 # rename weather to tools and all all the functions insdie
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    # stdio: spawned per client, http: long-lived streamable-HTTP server shared by many client sessions
+    parser.add_argument("--transport", choices=["stdio", "http"], default="stdio")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8082)
+    # print the import and init time of each step to stderr, then exit without serving
+    parser.add_argument("--profile-startup", action="store_true")
+    args = parser.parse_args()
+
+    if args.profile_startup:
+        # nothing heavy here, the shared http client is the only lazily created resource
+        with startup_profile.step("create http client"):
+            http.client
+        startup_profile.report()
+        raise SystemExit(0)
+
     # run the server
-    mcp.run(transport='stdio')
+    if args.transport == "http":
+        mcp.run(transport="streamable-http", host=args.host, port=args.port)
+    else:
+        mcp.run(transport='stdio')